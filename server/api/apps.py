@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Обертка execute ставится на соединения при подключении
+        from api import instrumentation  # noqa: F401
+        from api import checks  # noqa: F401
@@ -0,0 +1,132 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions, permissions, status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from api import instrumentation, projections, timeline
+from api.models import Follow, UserProfile
+from api.pagination import KeysetPagination, keyset_filter
+from api.serializers import UserProfileSerializer
+
+# Асинхронные версии читающих эндпоинтов. DRF не поддерживает async APIView,
+# поэтому AsyncAPIView повторяет нужную часть его конвейера: аутентификацию,
+# права и рендеринг; запросы к БД идут через async ORM без занятого потока.
+
+
+class AsyncAPIView(View):
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = [permissions.AllowAny]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    def get_permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    async def initial(self, request):
+        # Аутентификация JWT читает пользователя из БД - выполняем ее заранее в потоке
+        await sync_to_async(lambda: request.user)()
+        for permission in self.get_permissions():
+            if not permission.has_permission(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in self.authentication_classes])
+        self.request = request
+        try:
+            await self.initial(request)
+            handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            response = await handler(request, *args, **kwargs)
+        except Http404:
+            response = Response({'detail': exceptions.NotFound.default_detail}, status=status.HTTP_404_NOT_FOUND)
+        except exceptions.APIException as exc:
+            response = Response({'detail': exc.detail}, status=exc.status_code)
+        return self.finalize_response(request, response)
+
+    def finalize_response(self, request, response):
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        response.renderer_context = {'view': self, 'request': request, 'response': response}
+        return response
+
+
+async def apaginate(paginator, queryset, request):
+    size = paginator.get_page_size(request)
+    queryset = keyset_filter(queryset, paginator.get_position(request))
+    rows = [row async for row in queryset[:size + 1]]
+    return paginator.paginate_rows(rows, request)
+
+
+class AsyncPostListView(AsyncAPIView):
+    async def get(self, request):
+        paginator = KeysetPagination()
+        posts = await apaginate(paginator, projections.post_rows(), request)
+        with instrumentation.timer('serialize'):
+            data = projections.post_data(posts)
+        return paginator.get_paginated_response(data)
+
+
+class AsyncFeedView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        paginator = KeysetPagination()
+        posts = await timeline.aread_feed(
+            request.user,
+            paginator.get_position(request),
+            paginator.get_page_size(request),
+        )
+        posts = paginator.paginate_rows(posts, request)
+        with instrumentation.timer('serialize'):
+            data = projections.post_data(posts)
+        return paginator.get_paginated_response(data)
+
+
+class AsyncNotificationsView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        paginator = KeysetPagination()
+        notifications = await apaginate(paginator, projections.notification_rows(request.user.pk), request)
+        with instrumentation.timer('serialize'):
+            data = projections.notification_data(notifications)
+        return paginator.get_paginated_response(data)
+
+
+class AsyncUserProfileView(AsyncAPIView):
+    async def get(self, request, username):
+        async def is_following():
+            if not request.user.is_authenticated:
+                return False
+            return await Follow.objects.filter(follower_id=request.user.pk, following__username=username).aexists()
+
+        # Профиль и проверка подписки не зависят друг от друга и идут параллельно
+        profile, following = await asyncio.gather(
+            UserProfile.objects.select_related('user').filter(user__username=username).afirst(),
+            is_following(),
+        )
+        if profile is None:
+            user = await User.objects.filter(username=username).afirst()
+            if user is None:
+                raise Http404
+            profile = await UserProfile.objects.acreate(user=user, bio='', avatar=None)
+
+        profile.is_following = following
+        with instrumentation.timer('serialize'):
+            data = UserProfileSerializer(profile, context={'request': request}).data
+        return Response(data)
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+
+class ClaimsUser(TokenUser):
+    # Пользователь из claims access-токена. В ORM передается request.user.pk;
+    # запись User читается, только если понадобилось поле, которого нет в токене
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.pk)
+
+    @cached_property
+    def username(self):
+        return self.token.get('username') or self.user.username
+
+    @cached_property
+    def is_staff(self):
+        if 'is_staff' in self.token:
+            return self.token['is_staff']
+        return self.user.is_staff
+
+    def get_username(self):
+        return self.username
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    # Чтение (GET/HEAD/OPTIONS) обходится без запроса к БД: пользователь
+    # собирается из claims. Запросы, меняющие данные, получают полноценный User
+    # с проверкой is_active, как в JWTAuthentication. Деактивированный
+    # пользователь может читать до истечения access-токена (ACCESS_TOKEN_LIFETIME).
+
+    def authenticate(self, request):
+        if request.method not in SAFE_METHODS:
+            return super().authenticate(request)
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        return ClaimsUser(validated_token), validated_token
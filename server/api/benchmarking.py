@@ -0,0 +1,123 @@
+import random
+import time
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from api.counters import reconcile_counters
+from api.models import Comment, Follow, Notification, Post, UserProfile
+
+# Общие утилиты для команд bench_*: замеры времени и быстрое заполнение базы
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, repeat=50, warmup=3):
+    # Возвращает p50/p99/среднее в миллисекундах
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50': percentile(samples, 50),
+        'p99': percentile(samples, 99),
+        'mean': sum(samples) / len(samples),
+    }
+
+
+def format_timing(timing):
+    return f"p50={timing['p50']:.3f}ms p99={timing['p99']:.3f}ms mean={timing['mean']:.3f}ms"
+
+
+def _insert(model, rows, batch_size, ignore_conflicts=False):
+    # rows - любой итерируемый объект; в памяти держится одна пачка
+    rows = iter(rows)
+    inserted = 0
+    while batch := list(islice(rows, batch_size)):
+        model.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        inserted += len(batch)
+    return inserted
+
+
+def power_law_weights(n, alpha):
+    # Накопленные веса закона Ципфа для random.choices: i-й по рангу получает 1 / (i + 1) ** alpha
+    return list(accumulate(1 / (rank + 1) ** alpha for rank in range(n)))
+
+
+def seed_social_graph(users, posts, follows=0, likes=0, comments=0, notifications=0, alpha=1.1,
+                      batch_size=5000, prefix='bench', seed=None):
+    # Сидер с распределением "как в соцсети": немногие пользователи собирают
+    # большую часть подписчиков, пишут больше постов, а их посты получают
+    # больше лайков и комментариев. Пишется через bulk_create без сигналов и
+    # хеширования паролей; счетчики пересчитываются в конце, дубли подписок и
+    # лайков отбрасывает уникальный индекс (ignore_conflicts).
+    rng = random.Random(seed)
+    password = make_password(None)
+    stats = {}
+    with transaction.atomic():
+        _insert(User, (User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+                       for i in range(users)), batch_size)
+        user_ids = list(User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True))
+        _insert(UserProfile, (UserProfile(user_id=user_id) for user_id in user_ids), batch_size)
+        stats['users'] = len(user_ids)
+
+        # Популярность не совпадает с порядком id
+        popular = user_ids[:]
+        rng.shuffle(popular)
+        user_weights = power_law_weights(len(popular), alpha)
+
+        def pick_users(k):
+            return rng.choices(popular, cum_weights=user_weights, k=k)
+
+        def post_rows():
+            for i, author_id in enumerate(pick_users(posts)):
+                yield Post(author_id=author_id, content=f'post {i} from {prefix}')
+
+        _insert(Post, post_rows(), batch_size)
+        post_ids = list(Post.objects.filter(author_id__in=user_ids).order_by('id').values_list('id', flat=True))
+        stats['posts'] = len(post_ids)
+        hot_posts = post_ids[:]
+        rng.shuffle(hot_posts)
+        post_weights = power_law_weights(len(hot_posts), alpha)
+
+        def pick_posts(k):
+            return rng.choices(hot_posts, cum_weights=post_weights, k=k) if hot_posts else []
+
+        def follow_rows():
+            for follower_id, following_id in zip(rng.choices(user_ids, k=follows), pick_users(follows)):
+                if follower_id != following_id:
+                    yield Follow(follower_id=follower_id, following_id=following_id)
+
+        _insert(Follow, follow_rows(), batch_size, ignore_conflicts=True)
+
+        Like = Post.likes.through
+        _insert(Like, (Like(post_id=post_id, user_id=user_id)
+                       for post_id, user_id in zip(pick_posts(likes), rng.choices(user_ids, k=likes))),
+                batch_size, ignore_conflicts=True)
+
+        commented = zip(pick_posts(comments), rng.choices(user_ids, k=comments))
+        _insert(Comment, (Comment(post_id=post_id, author_id=author_id, content=f'comment {i}')
+                          for i, (post_id, author_id) in enumerate(commented)), batch_size)
+
+        _insert(Notification, (Notification(recipient_id=recipient_id, sender_id=rng.choice(user_ids),
+                                            notification_type='like', post_id=rng.choice(post_ids) if post_ids else None,
+                                            is_read=rng.random() < 0.8)
+                               for recipient_id in pick_users(notifications)), batch_size)
+        reconcile_counters()
+
+    stats['follows'] = Follow.objects.filter(follower_id__in=user_ids).count()
+    stats['likes'] = Like.objects.filter(user_id__in=user_ids).count()
+    stats['comments'] = Comment.objects.filter(author_id__in=user_ids).count()
+    stats['notifications'] = Notification.objects.filter(recipient_id__in=user_ids).count()
+    return stats
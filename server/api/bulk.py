@@ -0,0 +1,31 @@
+from django.db.models import F
+
+from api import cache as response_cache
+from api import notifications, timeline
+from api.models import Comment, Post, UserProfile
+
+# Пакетное создание постов и комментариев. bulk_create не отправляет
+# post_save, поэтому то, что для одиночной записи делают обработчики
+# сигналов в api.models (счетчики, версии кеша, лента, уведомления),
+# здесь выполняется явно - по одному запросу на пачку. Вызывать внутри
+# transaction.atomic().
+
+
+def create_posts(author, items):
+    posts = Post.objects.bulk_create([Post(author=author, **item) for item in items])
+    UserProfile.objects.filter(user_id=author.id).update(posts_count=F('posts_count') + len(posts))
+    response_cache.bump('user', author.id)
+    response_cache.bump('posts', 'all')
+    timeline.fan_out_posts(posts)
+    return posts
+
+
+def create_comments(post, author, items):
+    comments = Comment.objects.bulk_create([Comment(post=post, author=author, **item) for item in items])
+    Post.objects.filter(pk=post.pk).update(comments_count=F('comments_count') + len(comments))
+    response_cache.bump('post', post.pk)
+    response_cache.bump('user', post.author_id)
+    response_cache.bump('posts', 'all')
+    # Уведомления от одного отправителя к одному посту все равно склеиваются в одно
+    notifications.enqueue('comment', post.author_id, author.id, post_id=post.pk, comment_id=comments[-1].pk)
+    return comments
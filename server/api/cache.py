@@ -0,0 +1,119 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from api.routers import use_primary
+
+# Версионированный кеш ответов. Запись в кеше помнит версии сущностей,
+# от которых она построена (пользователь, пост); сигналы увеличивают версии,
+# и устаревшая запись просто перестает совпадать - ключи удалять не нужно.
+
+LOCK_TIMEOUT = 10
+# Сколько после мягкого истечения запись еще можно отдавать, пока ее перестраивают
+STALE_GRACE = 60
+LOCK_WAIT = 1.0
+LOCK_POLL = 0.05
+
+
+def _version_key(scope, pk):
+    return f'version:{scope}:{pk}'
+
+
+def get_version(scope, pk):
+    key = _version_key(scope, pk)
+    version = cache.get(key)
+    if version is None:
+        # Новая версия после вытеснения не должна совпасть со старыми записями
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(pairs):
+    # Версии сразу нескольких сущностей одним обращением к кешу: [(scope, pk), ...]
+    keys = [_version_key(scope, pk) for scope, pk in pairs]
+    found = cache.get_many(keys)
+    return [found[key] if key in found else get_version(scope, pk) for key, (scope, pk) in zip(keys, pairs)]
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump(scope, *pks):
+    keys = [_version_key(scope, pk) for pk in pks]
+    for key in keys:
+        _incr(key)
+    # Повтор после коммита: читатель, перестроивший запись между первым
+    # увеличением и коммитом, мог закешировать еще старые данные
+    transaction.on_commit(lambda: [_incr(key) for key in keys])
+
+
+class Dependencies:
+    def __init__(self):
+        self.versions = {}
+
+    def pin(self, scope, pk):
+        # Вызывается до чтения данных сущности из БД
+        self.versions[_version_key(scope, pk)] = get_version(scope, pk)
+
+    def is_current(self):
+        return cache.get_many(list(self.versions)) == self.versions
+
+
+def read_through(key, build, timeout=None):
+    # build(deps) возвращает значение и отмечает через deps.pin, от чего оно зависит
+    return _read_entry(key, build, timeout)['value']
+
+
+def read_through_tagged(key, build, timeout=None):
+    # То же, плюс тег записи для ETag: он меняется вместе с версиями зависимостей
+    entry = _read_entry(key, build, timeout)
+    return entry['value'], entry['tag']
+
+
+def _tag(key, deps):
+    return f'{key}:' + ','.join(f'{name}={version}' for name, version in sorted(deps.versions.items()))
+
+
+def _read_entry(key, build, timeout):
+    if timeout is None:
+        timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+    lock_key = f'lock:{key}'
+
+    entry = cache.get(key)
+    if entry is not None and entry['deps'].is_current():
+        # После мягкого истечения перестраивает один запрос, остальные отдают старое значение
+        if time.time() < entry['expires']:
+            return entry
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        if not locked:
+            return entry
+    else:
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        # Холодный ключ уже строит другой запрос - недолго ждем его результата
+        deadline = time.monotonic() + LOCK_WAIT
+        while not locked and time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = cache.get(key)
+            if entry is not None and entry['deps'].is_current():
+                return entry
+
+    try:
+        deps = Dependencies()
+        # Запись живет дольше отставания реплики и помечена свежими версиями,
+        # поэтому строится по default
+        with use_primary():
+            value = build(deps)
+        entry = {'deps': deps, 'value': value, 'tag': _tag(key, deps), 'expires': time.time() + timeout}
+        cache.set(key, entry, timeout + STALE_GRACE)
+        return entry
+    finally:
+        if locked:
+            cache.delete(lock_key)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.checks import Error, Tags, register
+
+# Счетчики SlidingWindowThrottle держатся на cache.incr. Бэкенды, не
+# переопределившие BaseCache.incr (файловый, БД), делают get + set: параллельные
+# процессы теряют увеличения, и лимит можно превысить. Такой конфиг не
+# запускаем молча.
+
+
+@register(Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    if not getattr(settings, 'THROTTLE_ENABLED', True):
+        return []
+    backend = caches['default']
+    if type(backend).incr is not BaseCache.incr:
+        return []
+    return [Error(
+        f'{type(backend).__name__} has no atomic incr, rate limits are not enforced reliably.',
+        hint='Use memcached or redis as the default cache (LocMemCache is fine for one process), '
+             'or disable throttling with THROTTLE_ENABLED=0.',
+        id='api.E001',
+    )]
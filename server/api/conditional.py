@@ -0,0 +1,36 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from api import cache as response_cache
+
+# Условные GET (If-None-Match -> 304). ETag строится до сериализации из
+# дешевых источников: версий сущностей в кеше (api.cache), которые
+# увеличиваются при каждом изменении, и адреса запроса. Совпал - ответ 304
+# без сериализации и рендеринга. ETag слабый: одинаковые данные могут
+# отличаться байтами (формат, сжатие).
+
+
+def make_etag(*parts):
+    return 'W/"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def page_etag(request, rows, *extra):
+    # Страница постов (строки projections.post_rows): id, версии постов
+    # (лайки, комментарии, правки) и их авторов
+    pairs = [('post', row['id']) for row in rows] + [('user', row['author_id']) for row in rows]
+    return make_etag(request.build_absolute_uri(), extra, [row['id'] for row in rows], response_cache.get_versions(pairs))
+
+
+def conditional_response(request, etag, build):
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    # Клиент хранит ответ, но каждый раз переспрашивает сервер
+    if request.user.is_authenticated:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,45 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Поля-счетчики и источник их реального значения: (модель, поле, связанная модель, внешний ключ)
+COUNTERS = (
+    ('Post', 'likes_count', 'likes', 'post'),
+    ('Post', 'comments_count', 'Comment', 'post'),
+    ('UserProfile', 'followers_count', 'Follow', 'following'),
+    ('UserProfile', 'following_count', 'Follow', 'follower'),
+    ('UserProfile', 'posts_count', 'Post', 'author'),
+)
+
+
+def _actual_count(apps, model_name, source, fk):
+    if source == 'likes':
+        related = apps.get_model('api', 'Post').likes.through
+    else:
+        related = apps.get_model('api', source)
+    # Для профиля считаем по user_id, для поста - по его pk
+    outer = 'user_id' if model_name == 'UserProfile' else 'pk'
+    counted = (
+        related.objects.filter(**{f'{fk}_id': OuterRef(outer)})
+        .order_by()
+        .values(f'{fk}_id')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def reconcile_counters(apps=global_apps, dry_run=False):
+    # Находит строки с разошедшимися счетчиками и чинит их одним UPDATE на счетчик
+    drifted = {}
+    for model_name, field, source, fk in COUNTERS:
+        model = apps.get_model('api', model_name)
+        actual = _actual_count(apps, model_name, source, fk)
+        stale = model.objects.annotate(actual=actual).exclude(**{field: F('actual')})
+        if dry_run:
+            drifted[f'{model_name}.{field}'] = stale.count()
+        else:
+            drifted[f'{model_name}.{field}'] = model.objects.filter(
+                pk__in=stale.values('pk')
+            ).update(**{field: actual})
+    return drifted
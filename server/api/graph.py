@@ -0,0 +1,185 @@
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Граф подписок в памяти процесса: для каждого пользователя отсортированные
+# массивы id подписчиков и подписок. Загружается лениво при первом обращении,
+# дальше поддерживается сигналами Follow после коммита. Записи из других
+# процессов этот процесс не видит, поэтому граф перечитывается раз в
+# FOLLOW_GRAPH_MAX_AGE секунд - в фоновом потоке, запросы тем временем читают
+# прежнюю копию. Из-за этого отставания граф используется только там, где
+# оно допустимо: общие подписки и рекомендации (api.queries).
+
+EMPTY = array('q')
+
+
+# Массивы не меняются на месте: читатели из других потоков продолжают
+# работать со своей копией, пока запись подменяет ее новой
+
+
+def _insert(index, key, value):
+    ids = index.get(key, EMPTY)
+    position = bisect_left(ids, value)
+    if position == len(ids) or ids[position] != value:
+        index[key] = ids[:position] + array('q', [value]) + ids[position:]
+
+
+def _remove(index, key, value):
+    ids = index.get(key, EMPTY)
+    position = bisect_left(ids, value)
+    if position < len(ids) and ids[position] == value:
+        if len(ids) == 1:
+            del index[key]
+        else:
+            index[key] = ids[:position] + ids[position + 1:]
+
+
+def _contains(ids, value):
+    position = bisect_left(ids, value)
+    return position < len(ids) and ids[position] == value
+
+
+def _intersect(left, right):
+    # Слияние двух отсортированных массивов
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] == right[j]:
+            result.append(left[i])
+            i += 1
+            j += 1
+        elif left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+class FollowGraph:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._followers = {}
+        self._following = {}
+        self._loaded_at = None
+        # Пока идет фоновая перезагрузка, изменения копятся здесь и
+        # применяются к новой копии перед подменой
+        self._pending = None
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'FOLLOW_GRAPH_ENABLED', False)
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            # Первая загрузка синхронная: отвечать пока нечем
+            with self._lock:
+                if self._loaded_at is None:
+                    self._followers, self._following = self._read()
+                    self._loaded_at = time.monotonic()
+            return
+        max_age = getattr(settings, 'FOLLOW_GRAPH_MAX_AGE', 300)
+        if time.monotonic() - self._loaded_at >= max_age:
+            self.reload_in_background()
+
+    @staticmethod
+    def _read():
+        from api.models import Follow
+
+        followers, following = {}, {}
+        edges = Follow.objects.values_list('follower_id', 'following_id').iterator(chunk_size=10000)
+        for follower_id, following_id in edges:
+            followers.setdefault(following_id, []).append(follower_id)
+            following.setdefault(follower_id, []).append(following_id)
+        return (
+            {key: array('q', sorted(ids)) for key, ids in followers.items()},
+            {key: array('q', sorted(ids)) for key, ids in following.items()},
+        )
+
+    def reload_in_background(self):
+        with self._lock:
+            if self._pending is not None:
+                return None
+            self._pending = []
+        thread = threading.Thread(target=self._reload, name='follow-graph-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def _reload(self):
+        try:
+            followers, following = self._read()
+            with self._lock:
+                for apply, follower_id, following_id in self._pending:
+                    apply(followers, following_id, follower_id)
+                    apply(following, follower_id, following_id)
+                self._followers, self._following = followers, following
+                self._loaded_at = time.monotonic()
+        except Exception:
+            # Остается прежняя копия, следующее обращение попробует снова
+            logger.exception('Failed to reload the follow graph')
+        finally:
+            with self._lock:
+                self._pending = None
+            connection.close()
+
+    def reset(self):
+        with self._lock:
+            self._followers, self._following = {}, {}
+            self._loaded_at = None
+
+    def _change(self, apply, follower_id, following_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            apply(self._followers, following_id, follower_id)
+            apply(self._following, follower_id, following_id)
+            if self._pending is not None:
+                self._pending.append((apply, follower_id, following_id))
+
+    def add(self, follower_id, following_id):
+        self._change(_insert, follower_id, following_id)
+
+    def remove(self, follower_id, following_id):
+        self._change(_remove, follower_id, following_id)
+
+    def followers(self, user_id):
+        self._ensure_loaded()
+        return self._followers.get(user_id, EMPTY)
+
+    def following(self, user_id):
+        self._ensure_loaded()
+        return self._following.get(user_id, EMPTY)
+
+    def follower_count(self, user_id):
+        return len(self.followers(user_id))
+
+    def following_count(self, user_id):
+        return len(self.following(user_id))
+
+    def is_following(self, follower_id, following_id):
+        return _contains(self.following(follower_id), following_id)
+
+    def mutuals(self, user_id):
+        return _intersect(self.followers(user_id), self.following(user_id))
+
+    def suggestions(self, user_id, limit=10, max_fanout=1000):
+        # Друзья друзей, ранжированные по числу общих подписок; у очень популярных
+        # аккаунтов учитываем только первые max_fanout подписок
+        following = self.following(user_id)
+        scores = Counter()
+        for friend_id in following:
+            for candidate_id in self.following(friend_id)[:max_fanout]:
+                if candidate_id != user_id and not _contains(following, candidate_id):
+                    scores[candidate_id] += 1
+        return [user for user, _ in heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))]
+
+
+graph = FollowGraph()
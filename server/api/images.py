@@ -0,0 +1,136 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from api import cache as response_cache
+from api.storage import acquire, content_storage, delete_unreferenced, release
+
+logger = logging.getLogger(__name__)
+
+# Уменьшенные копии аватаров. Оригинал сохраняется как есть, а квадратные
+# варианты фиксированных размеров (WebP и JPEG для старых клиентов) строятся
+# после коммита в пуле потоков - Pillow отпускает GIL на декодировании,
+# масштабировании и кодировании. Пути вариантов лежат в
+# UserProfile.avatar_variants: {'64': {'webp': ..., 'jpeg': ...}, ...}.
+
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+VARIANTS_DIR = 'avatars/variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_sizes():
+    return getattr(settings, 'AVATAR_VARIANT_SIZES', (64, 256))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AVATAR_WORKERS', 2),
+                    thread_name_prefix='avatar-variants',
+                )
+    return _executor
+
+
+def render_variants(name):
+    # Читает оригинал из хранилища; варианты, как и оригинал, адресуются по содержимому
+    sizes = sorted(variant_sizes(), reverse=True)
+    with content_storage.open(name) as source:
+        image = Image.open(source)
+        # JPEG декодируется сразу в уменьшенном масштабе, не крупнее нужного
+        image.draft('RGB', (sizes[0], sizes[0]))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # Прозрачность уходит в белый фон - JPEG ее не поддерживает
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        image = image.convert('RGB')
+
+    variants = {}
+    for size in sizes:
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        variants[str(size)] = {}
+        for extension, image_format, options in FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            path = content_storage.save(f'{VARIANTS_DIR}/{size}.{extension}', ContentFile(buffer.getvalue()))
+            variants[str(size)][extension] = path
+    return variants
+
+
+def variant_paths(variants):
+    return [path for formats in (variants or {}).values() for path in formats.values()]
+
+
+def delete_variants(variants):
+    # Одинаковые аватары делят файлы вариантов - файл удаляется с последней ссылкой
+    release(variant_paths(variants))
+
+
+def build_variants(profile_id):
+    from api.models import UserProfile
+
+    profile = UserProfile.objects.filter(pk=profile_id).values('user_id', 'avatar').first()
+    if profile is None or not profile['avatar']:
+        return None
+    variants = render_variants(profile['avatar'])
+    with transaction.atomic():
+        current = UserProfile.objects.select_for_update().filter(pk=profile_id).values('avatar', 'avatar_variants').first()
+        # Пока варианты строились, аватар могли сменить - тогда результат выбрасывается
+        stale = current is None or current['avatar'] != profile['avatar']
+        if not stale:
+            UserProfile.objects.filter(pk=profile_id).update(avatar_variants=variants)
+            # Сначала новые ссылки: совпадающие с прежними файлы не должны удалиться
+            acquire(variant_paths(variants))
+            delete_variants(current['avatar_variants'])
+    if stale:
+        delete_unreferenced(variant_paths(variants))
+        return None
+    response_cache.bump('user', profile['user_id'])
+    return variants
+
+
+def _build_in_worker(profile_id):
+    try:
+        build_variants(profile_id)
+    except Exception:
+        logger.exception('Failed to build avatar variants for profile %s', profile_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(profile, previous=None):
+    # Вызывается после сохранения нового аватара; previous - варианты старого
+    def submit():
+        delete_variants(previous)
+        if getattr(settings, 'AVATAR_PROCESSING_ASYNC', True):
+            _get_executor().submit(_build_in_worker, profile.pk)
+        else:
+            build_variants(profile.pk)
+
+    transaction.on_commit(submit)
+
+
+def variant_urls(variants, request=None):
+    urls = {}
+    for size, formats in (variants or {}).items():
+        urls[size] = {}
+        for extension, path in formats.items():
+            url = content_storage.url(path)
+            urls[size][extension] = request.build_absolute_uri(url) if request is not None else url
+    return urls
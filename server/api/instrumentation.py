@@ -0,0 +1,222 @@
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Замеры по запросам: число и время SQL, время сериализации и рендеринга,
+# размер ответа.
+# Обертка execute стоит на каждом соединении постоянно, но без активного
+# замера (PERF_SAMPLE_RATE = 0) сводится к чтению ContextVar. Контекст
+# переходит и в потоки sync_to_async, поэтому async-вью тоже учитываются.
+# Сводка копится в памяти процесса и отдается api/internal/metrics/.
+
+DEFAULT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_current = ContextVar('perf_recorder', default=None)
+
+# Форма запроса без конкретных значений: IN (%s, %s, ...) и числа сворачиваются
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def sql_shape(sql):
+    return _NUMBER.sub('N', _IN_LIST.sub('IN (...)', sql))
+
+
+class Recorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = Counter()
+        self.shapes = Counter()
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.shapes[sql_shape(sql)] += 1
+
+    def repeated_shapes(self):
+        threshold = getattr(settings, 'PERF_N_PLUS_ONE_THRESHOLD', 10)
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.record_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+@contextmanager
+def timer(name):
+    # Отдельная фаза запроса для Server-Timing: serialize (сериализаторы и
+    # проекции во вью), render (кодирование JSON). SQL внутри фазы учитывается
+    # и в ней, и в db
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.timings[name] += time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [f'le_{bucket}' for bucket in self.buckets] + ['inf']
+        return {'buckets': dict(zip(labels, self.counts)), 'sum': round(self.total, 3)}
+
+
+class ViewStats:
+    def __init__(self, buckets):
+        self.count = 0
+        self.duration = Histogram(buckets)
+        self.db_time = Histogram(buckets)
+        self.queries = Histogram((1, 2, 5, 10, 20, 50, 100))
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.bytes = 0
+        self.n_plus_one = 0
+        self.last_n_plus_one = None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'duration_ms': self.duration.as_dict(),
+            'db_ms': self.db_time.as_dict(),
+            'queries': self.queries.as_dict(),
+            'serialize_ms': round(self.serialize_time, 3),
+            'render_ms': round(self.render_time, 3),
+            'bytes': self.bytes,
+            'n_plus_one': self.n_plus_one,
+            'last_n_plus_one': self.last_n_plus_one,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view, duration, recorder, size, repeated):
+        buckets = getattr(settings, 'PERF_HISTOGRAM_BUCKETS', DEFAULT_BUCKETS)
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats(buckets)
+            stats.count += 1
+            stats.duration.add(duration * 1000)
+            stats.db_time.add(recorder.db_time * 1000)
+            stats.queries.add(recorder.queries)
+            stats.serialize_time += recorder.timings['serialize'] * 1000
+            stats.render_time += recorder.timings['render'] * 1000
+            stats.bytes += size or 0
+            if repeated:
+                stats.n_plus_one += 1
+                stats.last_n_plus_one = {'sql': repeated[0][0], 'count': repeated[0][1]}
+
+    def snapshot(self):
+        with self._lock:
+            return {view: stats.as_dict() for view, stats in sorted(self._views.items())}
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+
+registry = Registry()
+
+
+def _sampled():
+    rate = getattr(settings, 'PERF_SAMPLE_RATE', 0.0)
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def _server_timing(duration, recorder):
+    parts = [f'db;dur={recorder.db_time * 1000:.2f};desc="{recorder.queries} queries"']
+    for name, value in sorted(recorder.timings.items()):
+        parts.append(f'{name};dur={value * 1000:.2f}')
+    parts.append(f'total;dur={duration * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _sampled():
+            return self.get_response(request)
+        recorder = Recorder()
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not _sampled():
+            return await self.get_response(request)
+        recorder = Recorder()
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        duration = time.perf_counter() - recorder.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        repeated = recorder.repeated_shapes()
+        if repeated:
+            shape, count = repeated[0]
+            logger.warning('Possible N+1 in %s: %d x %s', view, count, shape)
+        registry.add(view, duration, recorder, size, repeated)
+        response['Server-Timing'] = _server_timing(duration, recorder)
+        return response
@@ -0,0 +1,57 @@
+from django.db import IntegrityError, router, transaction
+from django.db.models.signals import m2m_changed
+
+from api.models import Post
+
+# Лайки пишутся напрямую в промежуточную таблицу Post.likes: проверка -
+# один индексный запрос, вставка идемпотентна, удаление возвращает то, что
+# действительно удалено. Затем отправляется m2m_changed с реально
+# измененными постами, и счетчики, кеш и уведомления обновляют обычные
+# обработчики сигналов, как после post.likes.add().
+
+Like = Post.likes.through
+
+
+def _changed(user, action, post_ids):
+    if post_ids:
+        m2m_changed.send(
+            sender=Like,
+            instance=user,
+            action=action,
+            reverse=True,
+            model=Post,
+            pk_set=set(post_ids),
+            using=router.db_for_write(Like),
+        )
+
+
+def like(user, post_ids):
+    # Возвращает id постов, лайк на которые поставлен этим вызовом
+    with transaction.atomic():
+        existing = set(Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True))
+        liked = []
+        for post_id in post_ids:
+            if post_id in existing:
+                continue
+            try:
+                # Параллельный запрос мог успеть вставить ту же строку - уникальный индекс решает, кто первый
+                with transaction.atomic():
+                    Like.objects.create(user=user, post_id=post_id)
+            except IntegrityError:
+                continue
+            existing.add(post_id)
+            liked.append(post_id)
+        _changed(user, 'post_add', liked)
+    return liked
+
+
+def unlike(user, post_ids):
+    # Возвращает id постов, с которых лайк снят этим вызовом
+    with transaction.atomic():
+        # Строки блокируются до удаления: параллельный unlike получит их уже удаленными
+        rows = Like.objects.select_for_update().filter(user=user, post_id__in=post_ids)
+        removed = dict(rows.values_list('id', 'post_id'))
+        if removed:
+            Like.objects.filter(id__in=removed).delete()
+        _changed(user, 'post_remove', removed.values())
+    return list(removed.values())
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmarking import percentile
+
+# Пары (синхронный, асинхронный) эндпоинтов; прогоняются через ASGI-обработчик AsyncClient
+ENDPOINTS = (
+    ('post-list-create', 'async-post-list', False),
+    ('feed', 'async-feed', False),
+    ('notifications', 'async-notifications', False),
+    ('user-profile', 'async-user-profile', True),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and latency of the sync read views with their async variants under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to authenticate as (defaults to the user with most follows)')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        user = self.pick_user(options['username'])
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+        # Тестовый клиент ходит с Host: testserver, лимиты частоты не мешают замеру
+        measured = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], THROTTLE_ENABLED=False)
+        with measured:
+            for sync_name, async_name, by_username in ENDPOINTS:
+                args = [user.username] if by_username else []
+                self.stdout.write(self.style.MIGRATE_HEADING(sync_name))
+                for label, name in (('sync ', sync_name), ('async', async_name)):
+                    result = asyncio.run(self.load(reverse(name, args=args), headers, options['requests'], options['concurrency']))
+                    line = (f"  {label} {result['rps']:8.1f} req/s  p50={result['p50']:.2f}ms  "
+                            f"p99={result['p99']:.2f}ms  errors={result['errors']}")
+                    self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist')
+        user = User.objects.order_by('-profile__following_count').first()
+        if user is None:
+            raise CommandError('No users, seed the database first')
+        return user
+
+    async def load(self, url, headers, total, concurrency):
+        client = AsyncClient()
+        latencies = []
+        errors = 0
+        remaining = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            'rps': total / elapsed,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'errors': errors,
+        }
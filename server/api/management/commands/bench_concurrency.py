@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmarking import percentile
+from api.models import Post
+
+# Чтения под нагрузкой записей на настоящих соединениях: каждый поток - свое
+# соединение с базой. Писатели по кругу лайкают/снимают лайк и подписываются/
+# отписываются, так что данные после прогона те же. Сравнить режимы можно,
+# запустив команду с DB_SQLITE_WAL=1 и без него на копиях одной базы.
+
+READ_ENDPOINTS = (
+    ('post-list-create', False),
+    ('user-profile', True),
+    ('user-posts', True),
+    ('feed', False),
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure read throughput and latency while the like and follow endpoints are under write load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by('-profile__following_count', 'id')[:options['readers'] + options['writers']])
+        posts = list(Post.objects.order_by('-id').values_list('id', flat=True)[:options['writers']])
+        if len(users) < options['readers'] + options['writers'] or len(posts) < options['writers']:
+            raise CommandError('Not enough data, seed the database first (manage.py seed_social_graph)')
+        target = User.objects.order_by('-profile__followers_count').first()
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                mode = cursor.fetchone()[0]
+            begin = connection.transaction_mode or 'DEFERRED'
+            self.stdout.write(self.style.MIGRATE_HEADING(f'SQLite journal_mode={mode}, BEGIN {begin}'))
+
+        stop = threading.Event()
+        stats = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+
+        def record(kind, latency, status):
+            with lock:
+                stats[kind].append(latency)
+                errors[kind] += status >= 400
+
+        def client_for(user):
+            # Ошибки (в том числе "database is locked") считаются, а не прерывают поток
+            return Client(raise_request_exception=False, headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'})
+
+        def reader(user):
+            client = client_for(user)
+            paths = [reverse(name, args=[target.username] if by_username else []) for name, by_username in READ_ENDPOINTS]
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                status = client.get(paths[i % len(paths)]).status_code
+                record('read', time.perf_counter() - started, status)
+                i += 1
+
+        def writer(user, post_id):
+            client = client_for(user)
+            liked = Post.likes.through.objects.filter(post_id=post_id, user=user).exists()
+            follows = user.following.filter(following=target).exists()
+            i = 0
+            while not stop.is_set():
+                if i % 2:
+                    path = reverse('unfollow-user' if follows else 'follow-user', args=[target.username])
+                    follows = not follows
+                else:
+                    path = reverse('post-unlike' if liked else 'post-like', args=[post_id])
+                    liked = not liked
+                started = time.perf_counter()
+                status = client.post(path, json.dumps({}), content_type='application/json').status_code
+                record('write', time.perf_counter() - started, status)
+                i += 1
+
+        def run(target_fn, *args):
+            try:
+                target_fn(*args)
+            finally:
+                connections.close_all()
+
+        readers = users[:options['readers']]
+        writers = users[options['readers']:]
+        threads = [threading.Thread(target=run, args=(reader, user)) for user in readers]
+        threads += [threading.Thread(target=run, args=(writer, user, post_id)) for user, post_id in zip(writers, posts)]
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], THROTTLE_ENABLED=False):
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(options['duration'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        for kind, count in (('read', options['readers']), ('write', options['writers'])):
+            latencies = [latency * 1000 for latency in stats[kind]]
+            self.stdout.write(
+                f'  {kind:<5} x{count:<3} {len(latencies) / elapsed:8.1f} req/s  p50={percentile(latencies, 50):.2f}ms  '
+                f'p99={percentile(latencies, 99):.2f}ms  errors={errors[kind]}'
+            )
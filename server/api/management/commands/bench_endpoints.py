@@ -0,0 +1,273 @@
+import json
+import re
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api.benchmarking import percentile
+from api.models import Comment, Follow, Post
+from api.urls import urlpatterns
+
+# Прогон всех эндпоинтов api/urls.py: пропускная способность, p50/p99 и число
+# SQL-запросов на запрос (из заголовка Server-Timing, см. api.instrumentation).
+# Пишущие запросы выполняются в точке сохранения и откатываются, поэтому база
+# не меняется и каждый повтор видит одни и те же данные.
+
+# Эндпоинты, которые не гоняются сознательно
+SKIPPED = {
+    'event-stream': 'streaming response',
+    'internal-metrics': 'staff only',
+}
+
+BENCH_PASSWORD = 'Bench-pass-12345'
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Scenario:
+    def __init__(self, url_name, method='get', args=(), data=None, query=None, auth=True, label=None):
+        self.url_name = url_name
+        self.method = method
+        self.args = args
+        self.data = data
+        self.query = query or ''
+        self.auth = auth
+        self.label = label or f'{method.upper()} {url_name}'
+
+    @property
+    def safe(self):
+        return self.method == 'get'
+
+    def path(self):
+        path = reverse(self.url_name, args=self.args)
+        return f'{path}?{self.query}' if self.query else path
+
+
+class Command(BaseCommand):
+    help = 'Drive every API endpoint and report throughput, p50/p99 latency and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--username', help='User to act as (defaults to the user following the most people)')
+        parser.add_argument('--only', nargs='+', help='URL names to run')
+        parser.add_argument('--base-url', help='Run read endpoints against a running server instead of the test client')
+        parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare with this JSON file and fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p50 slowdown against the baseline')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        # Фикстуры (пароль пользователя) тоже откатываются по окончании;
+        # тестовый клиент ходит с Host: testserver, лимиты частоты не мешают замеру
+        measured = override_settings(
+            PERF_SAMPLE_RATE=1.0, THROTTLE_ENABLED=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        )
+        with transaction.atomic(), measured:
+            fixtures = self.fixtures(options['username'], set_password=not options['base_url'])
+            scenarios = [s for s in self.scenarios(fixtures) if not options['only'] or s.url_name in options['only']]
+            self.report_coverage(scenarios, options['only'])
+            if options['base_url']:
+                scenarios = [s for s in scenarios if s.safe]
+                send = self.remote(options['base_url'])
+            else:
+                send = self.local()
+
+            results = {}
+            for scenario in scenarios:
+                results[scenario.label] = self.run(scenario, send, fixtures, options['requests'], options['warmup'])
+                self.stdout.write(self.format(scenario.label, results[scenario.label]))
+            transaction.set_rollback(True)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['save_baseline']}"))
+        if baseline is not None:
+            self.compare(results, baseline, options['tolerance'])
+
+    def fixtures(self, username, set_password=True):
+        if username:
+            try:
+                user = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist')
+        else:
+            user = User.objects.order_by('-profile__following_count', 'id').first()
+        if user is None:
+            raise CommandError('No users, seed the database first (manage.py seed_social_graph)')
+        if set_password:
+            user.set_password(BENCH_PASSWORD)
+            user.save(update_fields=['password'])
+
+        target = User.objects.exclude(pk=user.pk).order_by('-profile__followers_count', 'id').first()
+        post = Post.objects.order_by('-comments_count', '-id').first()
+        if target is None or post is None:
+            raise CommandError('Not enough data, seed the database first (manage.py seed_social_graph)')
+        followed = Follow.objects.filter(follower=user).values_list('following__username', flat=True).first()
+        not_followed = User.objects.exclude(pk=user.pk).exclude(followers__follower=user).order_by('id').first()
+        return {
+            'user': user,
+            'access': str(AccessToken.for_user(user)),
+            'refresh': str(RefreshToken.for_user(user)),
+            'target': target,
+            'post': post,
+            'comment': Comment.objects.filter(post=post).order_by('-id').first(),
+            'own_post': Post.objects.filter(author=user).order_by('-id').first(),
+            'liked': Post.objects.filter(likes=user).order_by('-id').first(),
+            'not_liked': Post.objects.exclude(likes=user).order_by('-id').first(),
+            'followed': followed,
+            'not_followed': not_followed.username if not_followed else None,
+        }
+
+    def scenarios(self, f):
+        user, target, post = f['user'], f['target'], f['post']
+        scenarios = [
+            Scenario('register', 'post', auth=False, data={
+                'username': 'bench-new-user', 'email': 'bench-new-user@example.com',
+                'password': BENCH_PASSWORD, 'password2': BENCH_PASSWORD,
+            }),
+            Scenario('login', 'post', auth=False, data={'username': user.username, 'password': BENCH_PASSWORD}),
+            Scenario('token_refresh', 'post', auth=False, data={'refresh': f['refresh']}),
+            Scenario('logout', 'post', data={'refresh': f['refresh']}),
+            Scenario('post-list-create'),
+            Scenario('post-list-create', query='page_size=100', label='GET post-list-create ?page_size=100'),
+            Scenario('post-list-create', 'post', data={'content': 'benchmark post'}),
+            Scenario('post-detail', args=[post.pk]),
+            Scenario('post-like-batch', 'post', data={'actions': [{'post': post.pk, 'action': 'like'}]}),
+            Scenario('post-comments', args=[post.pk]),
+            Scenario('post-comments', 'post', args=[post.pk], data={'content': 'benchmark comment'}),
+            Scenario('profile'),
+            Scenario('user-profile', args=[target.username]),
+            Scenario('user-posts', args=[target.username]),
+            Scenario('user-followers', args=[target.username]),
+            Scenario('user-following', args=[user.username]),
+            Scenario('user-mutuals', args=[target.username]),
+            Scenario('suggestions'),
+            Scenario('feed'),
+            Scenario('notifications'),
+            Scenario('notifications', 'patch'),
+            Scenario('stream-token', 'post'),
+            Scenario('search', query='q=post'),
+            Scenario('async-post-list'),
+            Scenario('async-feed'),
+            Scenario('async-notifications'),
+            Scenario('async-user-profile', args=[target.username]),
+        ]
+        if f['comment']:
+            scenarios.append(Scenario('comment-detail', args=[post.pk, f['comment'].pk]))
+        if f['own_post']:
+            scenarios.append(Scenario('post-detail', 'patch', args=[f['own_post'].pk], data={'content': 'edited'}))
+        if f['not_liked']:
+            scenarios.append(Scenario('post-like', 'post', args=[f['not_liked'].pk]))
+        if f['liked']:
+            scenarios.append(Scenario('post-unlike', 'post', args=[f['liked'].pk]))
+        if f['not_followed']:
+            scenarios.append(Scenario('follow-user', 'post', args=[f['not_followed']]))
+        if f['followed']:
+            scenarios.append(Scenario('unfollow-user', 'post', args=[f['followed']]))
+        return scenarios
+
+    def report_coverage(self, scenarios, only):
+        # Новый эндпоинт без сценария не должен выпасть из замеров молча
+        covered = {s.url_name for s in scenarios}
+        names = {pattern.name for pattern in urlpatterns if pattern.name}
+        for name in sorted(names - covered - set(SKIPPED)):
+            if not only or name in only:
+                self.stdout.write(self.style.WARNING(f'  not covered: {name} (no data for it)'))
+        for name, reason in sorted(SKIPPED.items()):
+            if not only or name in only:
+                self.stdout.write(f'  skipped: {name} ({reason})')
+
+    def local(self):
+        client = Client()
+
+        def send(scenario, access):
+            headers = {'Authorization': f'Bearer {access}'} if scenario.auth else {}
+            data = json.dumps(scenario.data) if scenario.data is not None else ''
+            request = getattr(client, scenario.method)
+            if scenario.safe:
+                response = request(scenario.path(), headers=headers)
+                return response.status_code, response.get('Server-Timing', '')
+            # Запись видна только внутри точки сохранения
+            with transaction.atomic():
+                response = request(scenario.path(), data, content_type='application/json', headers=headers)
+                transaction.set_rollback(True)
+            return response.status_code, response.get('Server-Timing', '')
+
+        return send
+
+    def remote(self, base_url):
+        def send(scenario, access):
+            request = urllib.request.Request(base_url.rstrip('/') + scenario.path())
+            if scenario.auth:
+                request.add_header('Authorization', f'Bearer {access}')
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    return response.status, response.headers.get('Server-Timing', '')
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers.get('Server-Timing', '')
+
+        return send
+
+    def run(self, scenario, send, fixtures, total, warmup):
+        for _ in range(warmup):
+            send(scenario, fixtures['access'])
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(total):
+            request_started = time.perf_counter()
+            status, timing = send(scenario, fixtures['access'])
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            errors += status >= 400
+            match = _QUERIES.search(timing)
+            if match:
+                queries.append(int(match.group(1)))
+        elapsed = time.perf_counter() - started
+        return {
+            'rps': total / elapsed,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'queries': max(queries) if queries else None,
+            'errors': errors,
+        }
+
+    def format(self, label, result):
+        queries = '-' if result['queries'] is None else result['queries']
+        line = (f"  {label:<45} {result['rps']:8.1f} req/s  p50={result['p50']:7.2f}ms  "
+                f"p99={result['p99']:7.2f}ms  queries={queries}")
+        if result['errors']:
+            return self.style.ERROR(f"{line}  errors={result['errors']}")
+        return line
+
+    def compare(self, results, baseline, tolerance):
+        failures = []
+        for label, result in results.items():
+            before = baseline.get(label)
+            if before is None:
+                continue
+            if result['errors'] > before['errors']:
+                failures.append(f"{label}: errors {before['errors']} -> {result['errors']}")
+            if before['queries'] is not None and result['queries'] is not None and result['queries'] > before['queries']:
+                failures.append(f"{label}: queries {before['queries']} -> {result['queries']}")
+            if result['p50'] > before['p50'] * (1 + tolerance):
+                failures.append(f"{label}: p50 {before['p50']:.2f}ms -> {result['p50']:.2f}ms")
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(f'  regression: {failure}'))
+            raise CommandError(f'{len(failures)} regression(s) against the baseline')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
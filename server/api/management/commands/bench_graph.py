@@ -0,0 +1,67 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from api.benchmarking import format_timing, measure
+from api.graph import graph as follow_graph
+from api.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Compare follow graph lookups through the ORM with the in-memory graph index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to query (defaults to the user with most follows)')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        user = self.pick_user(options['username'])
+        target = Follow.objects.filter(follower=user).values_list('following_id', flat=True).first() or user.id
+
+        started = time.perf_counter()
+        follow_graph.reset()
+        follow_graph.following(user.id)
+        self.stdout.write(f'graph load: {(time.perf_counter() - started) * 1000:.1f}ms')
+
+        cases = (
+            ('followers',
+             lambda: list(Follow.objects.filter(following=user).values_list('follower_id', flat=True)),
+             lambda: follow_graph.followers(user.id)),
+            ('following',
+             lambda: list(Follow.objects.filter(follower=user).values_list('following_id', flat=True)),
+             lambda: follow_graph.following(user.id)),
+            ('is_following',
+             lambda: Follow.objects.filter(follower=user, following_id=target).exists(),
+             lambda: follow_graph.is_following(user.id, target)),
+            ('follower_count',
+             lambda: Follow.objects.filter(following=user).count(),
+             lambda: follow_graph.follower_count(user.id)),
+            ('mutuals',
+             lambda: list(Follow.objects.filter(follower=user, following__following__following=user)
+                          .values_list('following_id', flat=True)),
+             lambda: follow_graph.mutuals(user.id)),
+            ('suggestions',
+             lambda: list(Follow.objects.filter(follower__followers__follower=user)
+                          .exclude(following=user)
+                          .exclude(following__followers__follower=user)
+                          .values('following_id').annotate(score=Count('id'))
+                          .order_by('-score', 'following_id')[:10]),
+             lambda: follow_graph.suggestions(user.id)),
+        )
+        for name, orm, graph in cases:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  orm   {format_timing(measure(orm, repeat=options['repeat']))}")
+            self.stdout.write(f"  graph {format_timing(measure(graph, repeat=options['repeat']))}")
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist')
+        user = User.objects.order_by('-profile__following_count').first()
+        if user is None:
+            raise CommandError('No users, seed the database first')
+        return user
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from api.benchmarking import format_timing, measure, seed_social_graph
+from api.models import Comment, Follow, Notification, Post
+
+INDEXED_MODELS = (Post, Comment, Follow, Notification)
+
+
+class Command(BaseCommand):
+    help = 'Compare query plans and latencies of the list access paths with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-users', type=int, default=0)
+        parser.add_argument('--seed-posts', type=int, default=0)
+        parser.add_argument('--seed-comments', type=int, default=0)
+        parser.add_argument('--seed-follows', type=int, default=0)
+        parser.add_argument('--seed-notifications', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['seed_users']:
+            self.stdout.write('Seeding dataset...')
+            seed_social_graph(
+                options['seed_users'], options['seed_posts'], follows=options['seed_follows'],
+                comments=options['seed_comments'], notifications=options['seed_notifications'],
+            )
+
+        queries = self.access_paths()
+        if not queries:
+            self.stdout.write(self.style.WARNING('Not enough data, run with --seed-* options'))
+            return
+
+        # "До": индексы удаляются внутри транзакции, которая затем откатывается
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+            before = self.run(queries, options['repeat'])
+            transaction.set_rollback(True)
+
+        after = self.run(queries, options['repeat'])
+
+        for name in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f'  before: {format_timing(before[name][1])}')
+            self.stdout.write(f'    {before[name][0]}')
+            self.stdout.write(f'  after:  {format_timing(after[name][1])}')
+            self.stdout.write(f'    {after[name][0]}')
+
+    def access_paths(self):
+        # Берем самые "тяжелые" значения, чтобы сравнение было честным
+        author = Post.objects.values('author').annotate(n=Count('id')).order_by('-n').first()
+        post = Comment.objects.values('post').annotate(n=Count('id')).order_by('-n').first()
+        recipient = Notification.objects.values('recipient').annotate(n=Count('id')).order_by('-n').first()
+        followed = Follow.objects.values('following').annotate(n=Count('id')).order_by('-n').first()
+        follower = Follow.objects.values('follower').annotate(n=Count('id')).order_by('-n').first()
+        if not all([author, post, recipient, followed, follower]):
+            return {}
+
+        page = ('-created_at', '-id')
+        return {
+            'posts page': Post.objects.order_by(*page)[:20],
+            'user posts page': Post.objects.filter(author_id=author['author']).order_by(*page)[:20],
+            'comments page': Comment.objects.filter(post_id=post['post']).order_by(*page)[:20],
+            'notifications page': Notification.objects.filter(recipient_id=recipient['recipient']).order_by(*page)[:20],
+            'unread notifications': Notification.objects.filter(recipient_id=recipient['recipient'], is_read=False).order_by(),
+            'followers page': Follow.objects.filter(following_id=followed['following']).order_by(*page)[:20],
+            'following page': Follow.objects.filter(follower_id=follower['follower']).order_by(*page)[:20],
+        }
+
+    def run(self, queries, repeat):
+        results = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain().replace('\n', '\n    ')
+            results[name] = (plan, measure(lambda: list(queryset.all()), repeat=repeat))
+        return results
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api import middleware, queries
+from api.benchmarking import format_timing, measure
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = 'Measure serialization, JSON rendering and compression of PostSerializer pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 500])
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed, the fast renderer falls back to json'))
+        encodings = ['gzip'] + (['br'] if middleware.brotli is not None else [])
+        repeat = options['repeat']
+
+        for size in options['sizes']:
+            posts = list(queries.post_list().order_by('-created_at', '-id')[:size])
+            if not posts:
+                raise CommandError('No posts, seed the database first')
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{len(posts)} posts'))
+
+            self.stdout.write(f"  serialize    {format_timing(measure(lambda: PostSerializer(posts, many=True).data, repeat=repeat))}")
+            data = {'next': None, 'results': PostSerializer(posts, many=True).data}
+            for label, renderer in (('json', JSONRenderer()), ('orjson', FastJSONRenderer())):
+                self.stdout.write(f'  render {label:<7}{format_timing(measure(lambda: renderer.render(data), repeat=repeat))}')
+
+            content = FastJSONRenderer().render(data)
+            self.stdout.write(f'  bytes        identity={len(content)}')
+            for encoding in encodings:
+                timing = measure(lambda: middleware.compress(content, encoding), repeat=repeat)
+                compressed = middleware.compress(content, encoding)
+                ratio = len(compressed) / len(content)
+                self.stdout.write(f'  {encoding:<12} bytes={len(compressed)} ({ratio:.0%}) {format_timing(timing)}')
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from api import projections
+from api.benchmarking import format_timing, measure
+from api.models import Comment, Notification, Post
+from api.serializers import CommentSerializer, NotificationSerializer, PostSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ModelSerializer list output with the .values() projections in api.projections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        size, repeat = options['size'], options['repeat']
+        post = Post.objects.annotate(n=Count('comments')).order_by('-n').first()
+        recipient_id = (
+            Notification.objects.values('recipient_id').annotate(n=Count('id')).order_by('-n')
+            .values_list('recipient_id', flat=True).first()
+        )
+        if post is None or recipient_id is None:
+            raise CommandError('Seed the database with posts, comments and notifications first')
+
+        cases = (
+            ('posts',
+             lambda: PostSerializer(Post.objects.select_related('author').order_by('-created_at')[:size], many=True).data,
+             lambda: projections.post_data(projections.post_rows().order_by('-created_at')[:size])),
+            ('comments',
+             lambda: CommentSerializer(Comment.objects.filter(post=post).select_related('author')
+                                       .order_by('-created_at')[:size], many=True).data,
+             lambda: projections.comment_data(projections.comment_rows(post).order_by('-created_at')[:size])),
+            ('notifications',
+             lambda: NotificationSerializer(Notification.objects.filter(recipient_id=recipient_id)
+                                            .select_related('sender', 'post').order_by('-created_at')[:size], many=True).data,
+             lambda: projections.notification_data(projections.notification_rows(recipient_id)
+                                                   .order_by('-created_at')[:size])),
+        )
+        for name, serializer, projection in cases:
+            rows = len(projection())
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name} ({rows} rows, query included)'))
+            self.stdout.write(f'  serializer  {format_timing(measure(serializer, repeat=repeat))}')
+            self.stdout.write(f'  projection  {format_timing(measure(projection, repeat=repeat))}')
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api import images
+from api.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Build resized avatar variants for profiles that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['force']:
+            profiles = profiles.filter(avatar_variants={})
+        profile_ids = list(profiles.values_list('id', flat=True))
+
+        def build(profile_id):
+            try:
+                return images.build_variants(profile_id), None
+            except Exception as exc:
+                return None, f'profile {profile_id}: {exc}'
+
+        def build_in_thread(profile_id):
+            try:
+                return build(profile_id)
+            finally:
+                connections.close_all()
+
+        built = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            if options['workers'] > 1:
+                results = executor.map(build_in_thread, profile_ids)
+            else:
+                results = map(build, profile_ids)
+            for variants, error in results:
+                if error:
+                    self.stderr.write(error)
+                elif variants:
+                    built += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Built avatar variants for {built} of {len(profile_ids)} profiles'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import NotificationEvent
+from api.notifications import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Drain the notification outbox (e.g. events left over after a restart)'
+
+    def handle(self, *args, **options):
+        events = NotificationEvent.objects.count()
+        notifications = 0
+        while batch := process_outbox():
+            notifications += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {events} events into {notifications} notifications')
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Drop and recreate the full-text search index (e.g. after a table was remade by a migration)'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            backend.uninstall(connection)
+            backend.install(connection)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index with {type(backend).__name__}'))
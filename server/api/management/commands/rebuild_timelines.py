@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Follow, TimelineEntry
+from api import timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized feed timelines from existing follows and posts'
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.select_related('follower', 'following').iterator()
+        rebuilt = 0
+
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            for follow in follows:
+                timeline.backfill_timeline(follow.follower, follow.following)
+                rebuilt += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt timelines for {rebuilt} follows ({TimelineEntry.objects.count()} entries)')
+        )
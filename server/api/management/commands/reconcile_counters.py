@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like/comment/follow/post counters that drifted from the real rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = reconcile_counters(dry_run=options['dry_run'])
+
+        for counter, rows in drifted.items():
+            self.stdout.write(f'{counter}: {rows} drifted rows')
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {sum(drifted.values())} drifted counters'))
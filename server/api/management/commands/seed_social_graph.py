@@ -0,0 +1,38 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from api.benchmarking import seed_social_graph
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic social graph with power-law followers, posts, likes and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=200000)
+        parser.add_argument('--likes', type=int, default=500000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--notifications', type=int, default=50000)
+        parser.add_argument('--alpha', type=float, default=1.1, help='Zipf exponent of popularity (higher - more skewed)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='bench', help='Username prefix, must not clash with existing users')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible dataset')
+        parser.add_argument('--timelines', action='store_true', help='Rebuild feed timelines afterwards')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = seed_social_graph(
+            options['users'], options['posts'],
+            follows=options['follows'], likes=options['likes'], comments=options['comments'],
+            notifications=options['notifications'], alpha=options['alpha'],
+            batch_size=options['batch_size'], prefix=options['prefix'], seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded ' + ', '.join(f'{count} {name}' for name, count in stats.items())
+            + f' in {time.perf_counter() - started:.1f}s'
+        ))
+        if options['timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
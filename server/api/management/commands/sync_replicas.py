@@ -0,0 +1,26 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica files (local stand-in for replication)'
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Replicas are only copied for SQLite, use database replication otherwise')
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('No replicas configured, set DB_REPLICAS')
+
+        primary.ensure_connection()
+        for alias in settings.REPLICA_DATABASES:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied default to {alias}'))
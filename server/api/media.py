@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+from django.views.static import serve
+
+from api.storage import digest_from_name
+
+# Раздача MEDIA_ROOT. Имя файла из хранилища api.storage - хеш содержимого,
+# поэтому он же служит ETag, а ответ можно кешировать навсегда. Перед
+# приложением может стоять веб-сервер с теми же заголовками.
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _etag(request, path):
+    digest = digest_from_name(path)
+    return f'"{digest}"' if digest else None
+
+
+@require_safe
+@condition(etag_func=_etag)
+def serve_media(request, path):
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if digest_from_name(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
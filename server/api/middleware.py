@@ -0,0 +1,86 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(header):
+    # {'br': 1.0, 'gzip': 0.8, ...} из Accept-Encoding; q=0 означает запрет
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(header):
+    encodings = accepted_encodings(header)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best = None
+    for encoding in candidates:
+        quality = encodings.get(encoding, encodings.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+    return gzip.compress(content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    # Как GZipMiddleware из Django, но с brotli и настраиваемым порогом.
+    # Потоковые ответы (SSE, файлы) не трогаем: их нельзя буферизовать,
+    # а картинки и так сжаты.
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Сжатое тело отличается байтами - сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class RateLimitHeadersMiddleware(MiddlewareMixin):
+    # RateLimit-Limit/Remaining/Reset по данным api.throttling (только у вью с лимитом)
+
+    def process_response(self, request, response):
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response['RateLimit-Limit'] = str(limit)
+            response['RateLimit-Remaining'] = str(remaining)
+            response['RateLimit-Reset'] = str(reset)
+        return response
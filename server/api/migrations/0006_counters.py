@@ -0,0 +1,70 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:17
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(related, fk, outer):
+    counted = (
+        related.objects.filter(**{f'{fk}_id': OuterRef(outer)})
+        .order_by()
+        .values(f'{fk}_id')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    # Запросы повторены здесь, а не взяты из api.counters: миграция не должна
+    # зависеть от того, как модуль выглядит в будущих версиях
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    Follow = apps.get_model('api', 'Follow')
+    UserProfile = apps.get_model('api', 'UserProfile')
+    Post.objects.update(
+        likes_count=_count(Post.likes.through, 'post', 'pk'),
+        comments_count=_count(Comment, 'post', 'pk'),
+    )
+    UserProfile.objects.update(
+        followers_count=_count(Follow, 'following', 'user_id'),
+        following_count=_count(Follow, 'follower', 'user_id'),
+        posts_count=_count(Post, 'author', 'user_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
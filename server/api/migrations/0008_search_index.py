@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from api.search import backend_for_vendor
+
+
+def install_search_index(apps, schema_editor):
+    backend_for_vendor(schema_editor.connection.vendor).install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    backend_for_vendor(schema_editor.connection.vendor).uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_access_path_indexes'),
+        # Триггеры на auth_user должны создаваться после всех перестроек этой таблицы
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:43
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=api.storage.ContentAddressedStorage(), upload_to='avatars/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_avatar_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='sender_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:24
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    # Ссылки из уже построенных вариантов аватаров
+    UserProfile = apps.get_model('api', 'UserProfile')
+    StoredFile = apps.get_model('api', 'StoredFile')
+    references = Counter()
+    for variants in UserProfile.objects.exclude(avatar_variants={}).values_list('avatar_variants', flat=True).iterator():
+        for formats in (variants or {}).values():
+            references.update(formats.values())
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, references=count) for name, count in references.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_notification_sender_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
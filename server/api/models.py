@@ -1,19 +1,36 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
+from api import cache as response_cache
+from api.graph import graph as follow_graph
+from api.storage import content_storage
+from api import images, notifications
+
 
 class Post(models.Model): 
     author = models.ForeignKey(User, on_delete=models.CASCADE , related_name='posts')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
+    # Денормализованные счетчики, поддерживаются сигналами ниже
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Индексы повторяют порядок курсорной пагинации (-created_at, -id)
+        indexes = [
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_page_idx'),
+            models.Index(fields=['-created_at', '-id'], name='post_page_idx'),
+        ]
 
 
     def like_count(self):
-        return self.likes.count()
+        return self.likes_count
     def __str__(self):
         return f"{self.user.username} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
@@ -23,18 +40,38 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_page_idx'),
+        ]
+
     def __str__(self):
         return f'{self.author.username} on {self.post.id}'
     
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
-    avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Файлы аватаров адресуются по содержимому (api.storage)
+    avatar = models.ImageField(upload_to='avatars/', storage=content_storage, blank=True, null=True)
+    # Уменьшенные копии аватара (api.images): {размер: {формат: путь}}
+    avatar_variants = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+class StoredFile(models.Model):
+    # Ссылки на файл в content_storage: одинаковые аватары делят одни и те же
+    # файлы вариантов, файл удаляется вместе с последней ссылкой (api.storage)
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
 class Follow(models.Model):
     follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
     following = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
@@ -42,6 +79,11 @@ class Follow(models.Model):
     
     class Meta:
         unique_together = ('follower', 'following')
+        # (follower, following) уже покрыт unique_together, эти индексы - для списков в обе стороны
+        indexes = [
+            models.Index(fields=['following', '-created_at', '-id'], name='follow_followers_page_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_following_page_idx'),
+        ]
     
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
@@ -59,14 +101,52 @@ class Notification(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     is_read = models.BooleanField(default=False)
+    # Сколько еще пользователей сделали то же самое ("X и еще 41 лайкнули ваш пост")
+    others_count = models.PositiveIntegerField(default=0)
+    # Все различные отправители склеенного уведомления, из них считается others_count
+    sender_ids = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notif_recipient_page_idx'),
+            # Частичный индекс: только непрочитанные, для PATCH /notifications/
+            models.Index(fields=['recipient'], condition=Q(is_read=False), name='notif_unread_idx'),
+        ]
     
     def __str__(self):
         return f"Notification for {self.recipient.username} from {self.sender.username}"
 
+class NotificationEvent(models.Model):
+    # Outbox: события пишутся в транзакции запроса, уведомления из них создает api.notifications
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    notification_type = models.CharField(max_length=10, choices=Notification.NOTIFICATION_TYPES)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.notification_type} event for {self.recipient_id} from {self.sender_id}"
+
+class TimelineEntry(models.Model):
+    # Материализованная лента: пост автора, разосланный подписчику при публикации
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_page_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.owner_id}'s timeline"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -78,3 +158,170 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
     else:
         UserProfile.objects.create(user=instance)
+
+
+# Счетчики обновляются одним UPDATE ... SET n = n + 1 в транзакции записи
+def _bump(model, delta, field, **lookup):
+    model.objects.filter(**lookup).update(**{field: F(field) + delta})
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, **kwargs):
+    if created:
+        _bump(UserProfile, 1, 'posts_count', user_id=instance.author_id)
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    _bump(UserProfile, -1, 'posts_count', user_id=instance.author_id)
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if created:
+        _bump(Post, 1, 'comments_count', pk=instance.post_id)
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    _bump(Post, -1, 'comments_count', pk=instance.post_id)
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, **kwargs):
+    if created:
+        _bump(UserProfile, 1, 'followers_count', user_id=instance.following_id)
+        _bump(UserProfile, 1, 'following_count', user_id=instance.follower_id)
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    _bump(UserProfile, -1, 'followers_count', user_id=instance.following_id)
+    _bump(UserProfile, -1, 'following_count', user_id=instance.follower_id)
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def count_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        _bump(Post, -1, 'likes_count', likes=instance)
+        return
+    if action == 'post_clear' and not reverse:
+        Post.objects.filter(pk=instance.pk).update(likes_count=0)
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        # user.liked_posts.add(...): pk_set - это id постов
+        _bump(Post, delta, 'likes_count', pk__in=pk_set)
+    else:
+        _bump(Post, delta * len(pk_set), 'likes_count', pk=instance.pk)
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user_likes(sender, instance, **kwargs):
+    # Строки лайков удаляются каскадом без m2m_changed
+    _bump(Post, -1, 'likes_count', likes=instance)
+
+
+# Инвалидация кеша ответов (api.cache): увеличиваем версии затронутых сущностей.
+# ('posts', 'all') - версия общего списка постов, от нее зависит его ETag
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    response_cache.bump('user', instance.pk)
+    response_cache.bump('posts', 'all')
+
+@receiver(pre_save, sender=User)
+def remember_username_change(sender, instance, update_fields=None, **kwargs):
+    # Сохранения вроде last_login (update_fields без username) не проверяем
+    if instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+    instance._username_changed = previous is not None and previous != instance.username
+
+@receiver(post_save, sender=User)
+def invalidate_commented_posts(sender, instance, **kwargs):
+    # ETag комментариев строится из версии поста, а в них есть имя автора:
+    # переименование увеличивает версии всех постов, где он комментировал
+    if not getattr(instance, '_username_changed', False):
+        return
+    instance._username_changed = False
+    post_ids = Comment.objects.filter(author=instance).values_list('post_id', flat=True).distinct()
+    response_cache.bump('post', *post_ids)
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile(sender, instance, **kwargs):
+    response_cache.bump('user', instance.user_id)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    response_cache.bump('post', instance.pk)
+    response_cache.bump('user', instance.author_id)
+    response_cache.bump('posts', 'all')
+
+def _post_author_id(comment):
+    # Пост обычно уже загружен вместе с комментарием (serializer.save(post=...))
+    if Comment.post.is_cached(comment):
+        return comment.post.author_id
+    return Post.objects.filter(pk=comment.post_id).values_list('author_id', flat=True).first()
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post(sender, instance, **kwargs):
+    response_cache.bump('post', instance.post_id)
+    response_cache.bump('posts', 'all')
+    # comment_count есть и в списке постов автора
+    author_id = _post_author_id(instance)
+    if author_id is not None:
+        response_cache.bump('user', author_id)
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    response_cache.bump('user', instance.follower_id, instance.following_id)
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def invalidate_liked_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    post_ids = pk_set if reverse else [instance.pk]
+    if not post_ids:
+        return
+    response_cache.bump('post', *post_ids)
+    response_cache.bump('posts', 'all')
+    authors = Post.objects.filter(pk__in=post_ids).values_list('author_id', flat=True).distinct()
+    response_cache.bump('user', *authors)
+
+
+# События уведомлений попадают в outbox в той же транзакции, что и действие
+@receiver(post_save, sender=Comment)
+def enqueue_comment_notification(sender, instance, created, **kwargs):
+    if created:
+        notifications.enqueue('comment', _post_author_id(instance), instance.author_id, post_id=instance.post_id, comment_id=instance.pk)
+
+@receiver(post_save, sender=Follow)
+def enqueue_follow_notification(sender, instance, created, **kwargs):
+    if created:
+        notifications.enqueue('follow', instance.following_id, instance.follower_id)
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def enqueue_like_notifications(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        for post_id, author_id in Post.objects.filter(pk__in=pk_set).values_list('id', 'author_id'):
+            notifications.enqueue('like', author_id, instance.pk, post_id=post_id)
+    else:
+        for user_id in pk_set:
+            notifications.enqueue('like', instance.author_id, user_id, post_id=instance.pk)
+
+
+# Граф подписок в памяти (api.graph) меняется только после коммита
+@receiver(post_save, sender=Follow)
+def add_follow_edge(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: follow_graph.add(instance.follower_id, instance.following_id))
+
+@receiver(post_delete, sender=Follow)
+def remove_follow_edge(sender, instance, **kwargs):
+    transaction.on_commit(lambda: follow_graph.remove(instance.follower_id, instance.following_id))
+
+
+# Удаленный профиль больше не ссылается на файлы вариантов аватара
+@receiver(post_delete, sender=UserProfile)
+def release_avatar_variants(sender, instance, **kwargs):
+    images.delete_variants(instance.avatar_variants)
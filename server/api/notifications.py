@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from api import pubsub
+
+logger = logging.getLogger(__name__)
+
+# Уведомления создаются вне запроса: обработчики пишут событие в outbox
+# (NotificationEvent) в своей транзакции, а фоновый поток пачкой превращает
+# события в уведомления, склеивая всплески в одно ("X и еще 41 ...").
+# Модели импортируются внутри функций: api.models сам импортирует этот модуль.
+
+
+def enqueue(notification_type, recipient_id, sender_id, post_id=None, comment_id=None):
+    from api.models import NotificationEvent
+
+    if recipient_id is None or recipient_id == sender_id:
+        return
+    NotificationEvent.objects.create(
+        notification_type=notification_type,
+        recipient_id=recipient_id,
+        sender_id=sender_id,
+        post_id=post_id,
+        comment_id=comment_id,
+    )
+    transaction.on_commit(worker.wake)
+
+
+def _group_key(event):
+    return (event.recipient_id, event.notification_type, event.post_id)
+
+
+def process_outbox(batch_size=None):
+    from api.models import Notification, NotificationEvent
+
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 1000)
+    with transaction.atomic():
+        # На PostgreSQL параллельные обработчики берут разные пачки; SQLite игнорирует блокировку
+        events = list(NotificationEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not events:
+            return []
+
+        groups = OrderedDict()
+        for event in events:
+            groups.setdefault(_group_key(event), []).append(event)
+
+        # Непрочитанное уведомление того же вида дополняется, а не дублируется.
+        # Фильтр по всем трем частям ключа, иначе у получателя с тысячами
+        # непрочитанных уведомлений о других постах пачка читает их все
+        post_ids = {key[2] for key in groups}
+        same_post = Q(post_id__in=post_ids - {None})
+        if None in post_ids:
+            same_post |= Q(post_id__isnull=True)
+        existing = Notification.objects.filter(
+            same_post,
+            is_read=False,
+            recipient_id__in={key[0] for key in groups},
+            notification_type__in={key[1] for key in groups},
+        )
+        unread = {}
+        for notification in existing.order_by('created_at'):
+            key = (notification.recipient_id, notification.notification_type, notification.post_id)
+            if key in groups:
+                unread[key] = notification
+
+        # Хранится ограниченная выборка отправителей: ее хватает, чтобы не считать
+        # повторные лайки одних и тех же людей, и строка не растет без предела
+        max_sender_ids = getattr(settings, 'NOTIFICATION_MAX_SENDER_IDS', 100)
+        created, updated = [], []
+        for key, group in groups.items():
+            latest = group[-1]
+            senders = list(dict.fromkeys(event.sender_id for event in group))
+            notification = unread.get(key)
+            if notification is None:
+                created.append(Notification(
+                    recipient_id=latest.recipient_id,
+                    sender_id=latest.sender_id,
+                    notification_type=latest.notification_type,
+                    post_id=latest.post_id,
+                    comment_id=latest.comment_id,
+                    others_count=len(senders) - 1,
+                    sender_ids=senders[:max_sender_ids],
+                ))
+            else:
+                # Повторный лайк/комментарий того же пользователя в следующей пачке не новый отправитель
+                known = set(notification.sender_ids) | {notification.sender_id}
+                new_senders = [sender_id for sender_id in senders if sender_id not in known]
+                notification.others_count += len(new_senders)
+                if len(notification.sender_ids) < max_sender_ids:
+                    notification.sender_ids = (notification.sender_ids + new_senders)[:max_sender_ids]
+                notification.sender_id = latest.sender_id
+                notification.comment_id = latest.comment_id
+                notification.created_at = latest.created_at
+                updated.append(notification)
+
+        Notification.objects.bulk_create(created)
+        Notification.objects.bulk_update(updated, ['sender', 'comment', 'others_count', 'sender_ids', 'created_at'])
+        NotificationEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        transaction.on_commit(lambda: publish_notifications(created + updated))
+    return created + updated
+
+
+def publish_notifications(notifications):
+    from api.models import Notification
+    from api.serializers import NotificationSerializer
+
+    broker = pubsub.get_broker()
+    ids = [n.pk for n in notifications if broker.has_subscribers(pubsub.user_channel(n.recipient_id))]
+    if not ids:
+        return
+    for notification in Notification.objects.filter(pk__in=ids).select_related('sender', 'post'):
+        data = NotificationSerializer(notification).data
+        pubsub.publish(pubsub.user_channel(notification.recipient_id), 'notification', data)
+
+
+class NotificationWorker:
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        if not getattr(settings, 'NOTIFICATIONS_ASYNC', True):
+            process_outbox()
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='notification-worker', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def run(self):
+        interval = getattr(settings, 'NOTIFICATION_POLL_INTERVAL', 5)
+        window = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 0.5)
+        while True:
+            self._wakeup.wait(interval)
+            # Короткая пауза собирает всплеск лайков в одну пачку
+            time.sleep(window)
+            self._wakeup.clear()
+            try:
+                while process_outbox():
+                    pass
+            except Exception:
+                logger.exception('Failed to process notification outbox')
+            finally:
+                close_old_connections()
+
+
+worker = NotificationWorker()
@@ -0,0 +1,100 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        created_at = None
+    if created_at is None:
+        raise NotFound('Invalid cursor.')
+    return created_at, pk
+
+
+def keyset_filter(queryset, position, time_field='created_at', pk_field='id'):
+    # Строки строго после позиции курсора в порядке (-created_at, -id)
+    queryset = queryset.order_by(f'-{time_field}', f'-{pk_field}')
+    if position is None:
+        return queryset
+    created_at, pk = position
+    return queryset.filter(
+        Q(**{f'{time_field}__lt': created_at}) |
+        Q(**{time_field: created_at, f'{pk_field}__lt': pk})
+    )
+
+
+class KeysetPagination:
+    # Курсорная пагинация по (created_at, id): каждая страница - один диапазонный
+    # проход по индексу на page_size + 1 строк, глубокие страницы не дороже первой
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, time_field='created_at', pk_field='id'):
+        self.time_field = time_field
+        self.pk_field = pk_field
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+        self.next_position = None
+        self.request = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_position(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        return decode_cursor(cursor)
+
+    def paginate_queryset(self, queryset, request):
+        size = self.get_page_size(request)
+        queryset = keyset_filter(queryset, self.get_position(request), self.time_field, self.pk_field)
+        return self.paginate_rows(list(queryset[:size + 1]), request)
+
+    def paginate_rows(self, rows, request):
+        # rows уже отсортированы и выбраны с запасом в одну строку
+        self.request = request
+        size = self.get_page_size(request)
+        if len(rows) > size:
+            rows = rows[:size]
+            last = rows[-1]
+            # Строки - модели или словари из .values()
+            if isinstance(last, dict):
+                self.next_position = (last[self.time_field], last[self.pk_field])
+            else:
+                self.next_position = (getattr(last, self.time_field), getattr(last, self.pk_field))
+        else:
+            self.next_position = None
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -1,6 +1,9 @@
 
+from django.contrib.auth.models import User
 from rest_framework import permissions
 
+from api.authentication import ClaimsUser
+
 class IsAuthorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request,view ,  obj):
         
@@ -13,3 +16,12 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         return obj.user == request.user
+
+class IsStaffInDatabase(permissions.BasePermission):
+    # is_staff из claims access-токена остается прежним до его истечения;
+    # служебные вью сверяются с БД, чтобы снятие прав действовало сразу
+    def has_permission(self, request, view):
+        user = request.user
+        if isinstance(user, ClaimsUser):
+            return User.objects.filter(pk=user.pk, is_staff=True, is_active=True).exists()
+        return bool(user and user.is_authenticated and user.is_staff)
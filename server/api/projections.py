@@ -0,0 +1,93 @@
+from django.db.models import F
+from django.db.models.functions import Substr
+from rest_framework import serializers
+
+from api.models import Comment, Notification, Post
+
+# Быстрый путь чтения для длинных списков: строки берутся через .values()
+# без создания моделей, а словари ответа собираются напрямую. Формат ответа
+# совпадает с PostSerializer, CommentSerializer и NotificationSerializer -
+# при изменении полей сериализатора нужно поменять и функции здесь.
+
+# Даты форматируются тем же полем DRF, что и в сериализаторах
+_datetime = serializers.DateTimeField()
+
+NOTIFICATION_EXCERPT_LENGTH = 50
+
+
+def post_rows(queryset=None):
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.values(
+        'id', 'author_id', 'content', 'created_at', 'likes_count', 'comments_count',
+        author_username=F('author__username'),
+    )
+
+
+def post_data(rows):
+    to_datetime = _datetime.to_representation
+    return [
+        {
+            'id': row['id'],
+            'author': row['author_username'],
+            'content': row['content'],
+            'created_at': to_datetime(row['created_at']),
+            'like_count': row['likes_count'],
+            'comment_count': row['comments_count'],
+        }
+        for row in rows
+    ]
+
+
+def comment_rows(post):
+    return Comment.objects.filter(post=post).values(
+        'id', 'post_id', 'content', 'created_at',
+        author_username=F('author__username'),
+    )
+
+
+def comment_data(rows):
+    to_datetime = _datetime.to_representation
+    return [
+        {
+            'id': row['id'],
+            'post': row['post_id'],
+            'author': row['author_username'],
+            'content': row['content'],
+            'created_at': to_datetime(row['created_at']),
+        }
+        for row in rows
+    ]
+
+
+def notification_rows(user):
+    # Из текста поста нужен только отрывок - остальное не читаем
+    return Notification.objects.filter(recipient=user).values(
+        'id', 'others_count', 'notification_type', 'is_read', 'created_at',
+        sender_username=F('sender__username'),
+        post_excerpt=Substr('post__content', 1, NOTIFICATION_EXCERPT_LENGTH + 1),
+    )
+
+
+def _excerpt(content):
+    if content is None:
+        return None
+    if len(content) > NOTIFICATION_EXCERPT_LENGTH:
+        return content[:NOTIFICATION_EXCERPT_LENGTH] + '...'
+    return content
+
+
+def notification_data(rows):
+    to_datetime = _datetime.to_representation
+    return [
+        {
+            'id': row['id'],
+            'sender': row['sender_username'],
+            'others_count': row['others_count'],
+            'notification_type': row['notification_type'],
+            'post_content': _excerpt(row['post_excerpt']),
+            'is_read': row['is_read'],
+            'created_at': to_datetime(row['created_at']),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Pub/sub для потоковых подписок. Публиковать можно из любого потока
+# (запросы, обработчик уведомлений), подписчики живут в event loop ASGI.
+# Брокер выбирается настройкой PUBSUB_BACKEND и может быть заменен внешним.
+
+
+class Subscription:
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, message):
+        # Медленный клиент теряет сообщения, а не копит их в памяти
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # Цикл уже закрыт - подписка умерла вместе с ним
+                self.unsubscribe(subscription)
+
+    def has_subscribers(self, channel):
+        return channel in self._channels
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'PUBSUB_BACKEND', 'api.pubsub.InProcessBroker'))()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def author_channel(user_id):
+    return f'author:{user_id}'
+
+
+def publish(channel, event, data):
+    get_broker().publish(channel, {'event': event, 'data': data})
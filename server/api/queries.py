@@ -0,0 +1,115 @@
+from django.db.models import Count, Exists, OuterRef, Value
+
+from api.graph import graph as follow_graph
+from api.models import Follow, Post
+
+# Планы выборки для списков: всё, что читают сериализаторы, загружается
+# заранее, поэтому число запросов не зависит от числа строк
+
+
+def post_list(queryset=None):
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('author')
+
+
+def _viewer_follows(request, outer):
+    viewer = getattr(request, 'user', None)
+    if viewer is not None and viewer.is_authenticated:
+        return Exists(Follow.objects.filter(follower_id=viewer.pk, following=OuterRef(outer)))
+    return Value(False)
+
+
+def user_list(queryset, request=None):
+    # С request подписка зрителя выбирается тем же запросом (viewer_follows)
+    queryset = queryset.select_related('profile')
+    if request is None:
+        return queryset
+    return queryset.annotate(viewer_follows=_viewer_follows(request, 'pk'))
+
+
+def follow_edges(side, request=None, **lookup):
+    # Списки подписчиков/подписок листаются по ребрам Follow (created_at, id),
+    # side - 'follower' или 'following', пользователь на этой стороне попадает в ответ
+    queryset = Follow.objects.filter(**lookup).select_related(f'{side}__profile')
+    if request is None:
+        return queryset
+    return queryset.annotate(viewer_follows=_viewer_follows(request, side))
+
+
+def edge_users(edges, side):
+    users = []
+    for edge in edges:
+        user = getattr(edge, side)
+        if hasattr(edge, 'viewer_follows'):
+            user.viewer_follows = edge.viewer_follows
+        users.append(user)
+    return users
+
+
+def remember_following(request, users):
+    # Ответы из аннотации viewer_follows попадают в тот же кеш запроса
+    if request is None:
+        return
+    known = request.__dict__.setdefault('_following_cache', {})
+    for user in users:
+        if hasattr(user, 'viewer_follows'):
+            known[user.pk] = user.viewer_follows
+
+
+def prefetch_following(request, user_ids):
+    # Один запрос на страницу: на кого из user_ids подписан зритель.
+    # Результат живет в кеше запроса и переиспользуется всеми сериализаторами
+    viewer = getattr(request, 'user', None)
+    if viewer is None or not viewer.is_authenticated:
+        return
+    known = request.__dict__.setdefault('_following_cache', {})
+    missing = {user_id for user_id in user_ids if user_id not in known}
+    if not missing:
+        return
+    followed = set(
+        Follow.objects.filter(follower_id=viewer.pk, following_id__in=missing)
+        .values_list('following_id', flat=True)
+    )
+    for user_id in missing:
+        known[user_id] = user_id in followed
+
+
+def is_following(request, user_id):
+    viewer = getattr(request, 'user', None)
+    # На себя подписаться нельзя (FollowUserView), свой профиль без запроса
+    if viewer is None or not viewer.is_authenticated or viewer.pk == user_id:
+        return False
+    prefetch_following(request, [user_id])
+    return request._following_cache[user_id]
+
+
+# Общие подписки и рекомендации терпят отставание графа в памяти (api.graph)
+# на FOLLOW_GRAPH_MAX_AGE; без графа - запросом к БД. Проверки подписки и
+# лента всегда читают БД
+
+
+def mutual_ids(user_id, limit):
+    if follow_graph.enabled():
+        return follow_graph.mutuals(user_id)[:limit]
+    followers = Follow.objects.filter(following_id=user_id).values('follower_id')
+    return list(
+        Follow.objects.filter(follower_id=user_id, following_id__in=followers)
+        .order_by('following_id')
+        .values_list('following_id', flat=True)[:limit]
+    )
+
+
+def suggested_ids(user_id, limit):
+    if follow_graph.enabled():
+        return follow_graph.suggestions(user_id, limit=limit)
+    following = Follow.objects.filter(follower_id=user_id).values('following_id')
+    return list(
+        Follow.objects.filter(follower_id__in=following)
+        .exclude(following_id=user_id)
+        .exclude(following_id__in=following)
+        .values('following_id')
+        .annotate(shared=Count('id'))
+        .order_by('-shared', 'following_id')
+        .values_list('following_id', flat=True)[:limit]
+    )
@@ -0,0 +1,127 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject
+
+# Чтение с реплик. В реплики уходят только чтения внутри безопасного запроса
+# (GET/HEAD/OPTIONS): фоновые потоки, команды и все запросы, меняющие данные,
+# работают с default. Пользователь, который только что что-то изменил,
+# REPLICA_STICKY_SECONDS читает из default (read-your-writes). Пользователь
+# известен после аутентификации DRF: Request.user записывает его и в
+# исходный HttpRequest, там его и смотрим.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('db_routing', default=None)
+
+
+def sticky_key(user_id):
+    return f'db-primary:{user_id}'
+
+
+def _resolved_user(request):
+    # До аутентификации DRF там ленивый объект AuthenticationMiddleware -
+    # вычислять его нельзя, это сам по себе запрос к базе
+    user = request.__dict__.get('user')
+    if user is None or isinstance(user, SimpleLazyObject):
+        return None
+    return user
+
+
+class RoutingState:
+    def __init__(self, request):
+        self.request = request
+        self.primary = request.method not in SAFE_METHODS
+        self.user_checked = False
+        # Одна реплика на весь запрос, чтобы чтения были согласованы между собой
+        self.replica = random.choice(settings.REPLICA_DATABASES)
+
+    def use_primary(self):
+        if self.primary:
+            return True
+        if not self.user_checked:
+            user = _resolved_user(self.request)
+            if user is not None:
+                self.user_checked = True
+                if user.is_authenticated and cache.get(sticky_key(user.pk)):
+                    self.primary = True
+        return self.primary
+
+
+@contextmanager
+def use_primary():
+    # Чтения внутри блока идут в default, даже в безопасном запросе
+    state = _state.get()
+    if state is None or state.primary:
+        yield
+        return
+    state.primary = True
+    try:
+        yield
+    finally:
+        state.primary = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.use_primary() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и default
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        token = _state.set(RoutingState(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.pin_writer(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        token = _state.set(RoutingState(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.pin_writer(request, response)
+        return response
+
+    def pin_writer(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        user = _resolved_user(request)
+        if user is not None and user.is_authenticated:
+            cache.set(sticky_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
@@ -0,0 +1,163 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.contrib.auth.models import User
+from django.utils.module_loading import import_string
+
+from api.models import Post
+
+# Поисковые бэкенды возвращают id в порядке релевантности, сами объекты
+# загружает SearchView через api.queries
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _read_connection(model):
+    # Поиск - чтение: запрос идет туда же, куда роутер отправил бы ORM (реплика)
+    return connections[router.db_for_read(model)]
+
+
+class SimpleSearchBackend:
+    # Запасной вариант без индекса: icontains и сортировка по дате
+    def install(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+    def search_posts(self, query, offset, limit):
+        posts = Post.objects.filter(content__icontains=query).order_by('-created_at', '-id')
+        return list(posts.values_list('id', flat=True)[offset:offset + limit])
+
+    def search_users(self, query, limit):
+        users = User.objects.filter(Q(username__icontains=query) | Q(email__icontains=query)).order_by('id')
+        return list(users.values_list('id', flat=True)[:limit])
+
+
+class SQLiteFTSSearchBackend(SimpleSearchBackend):
+    # FTS5 с внешним содержимым: индекс хранит только токены, триггеры
+    # обновляют его при вставке, изменении и удалении строк
+    TABLES = (
+        ('api_post_fts', 'api_post', ('content',), "unicode61 remove_diacritics 2"),
+        ('api_user_fts', 'auth_user', ('username', 'email'), 'trigram'),
+    )
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            for fts, table, columns, tokenizer in self.TABLES:
+                cols = ', '.join(columns)
+                new = ', '.join(f'new.{c}' for c in columns)
+                old = ', '.join(f'old.{c}' for c in columns)
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                    f"{cols}, content='{table}', content_rowid='id', tokenize='{tokenizer}')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                    f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+                )
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for fts, *_ in self.TABLES:
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+    def search_posts(self, query, offset, limit):
+        terms = _terms(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with _read_connection(Post).cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM api_post_fts WHERE api_post_fts MATCH %s '
+                'ORDER BY bm25(api_post_fts), rowid DESC LIMIT %s OFFSET %s',
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def search_users(self, query, limit):
+        query = query.strip()
+        # Триграммному индексу нужно минимум три символа
+        if len(query) < 3:
+            return super().search_users(query, limit)
+        phrase = '"' + query.replace('"', '""') + '"'
+        with _read_connection(User).cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM api_user_fts WHERE api_user_fts MATCH %s '
+                'ORDER BY bm25(api_user_fts) LIMIT %s',
+                [phrase, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SimpleSearchBackend):
+    # Функциональные GIN-индексы обновляются самой БД, отдельная индексация не нужна
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS api_post_content_fts_idx "
+                "ON api_post USING GIN (to_tsvector('simple', content))"
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS auth_user_username_trgm_idx '
+                'ON auth_user USING GIN (username gin_trgm_ops, email gin_trgm_ops)'
+            )
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS api_post_content_fts_idx')
+            cursor.execute('DROP INDEX IF EXISTS auth_user_username_trgm_idx')
+
+    def search_posts(self, query, offset, limit):
+        with _read_connection(Post).cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM api_post, websearch_to_tsquery('simple', %s) q "
+                "WHERE to_tsvector('simple', content) @@ q "
+                "ORDER BY ts_rank(to_tsvector('simple', content), q) DESC, id DESC LIMIT %s OFFSET %s",
+                [query, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def search_users(self, query, limit):
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        with _read_connection(User).cursor() as cursor:
+            cursor.execute(
+                'SELECT id FROM auth_user WHERE username ILIKE %s OR email ILIKE %s '
+                'ORDER BY similarity(username, %s) DESC, id LIMIT %s',
+                [pattern, pattern, query, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def backend_for_vendor(vendor):
+    return VENDOR_BACKENDS.get(vendor, SimpleSearchBackend)()
+
+
+def get_search_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return backend_for_vendor(_read_connection(Post).vendor)
@@ -1,8 +1,15 @@
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
+from api import images, queries, uploads
 from api.models import Comment, Follow, Notification, Post, UserProfile
+from api.tokens import RefreshToken
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
@@ -39,14 +46,12 @@ class RegisterSerializer(serializers.ModelSerializer):
 
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    like_count = serializers.SerializerMethodField()
+    like_count = serializers.ReadOnlyField(source='likes_count')
+    comment_count = serializers.ReadOnlyField(source='comments_count')
     class Meta:
         model = Post
-        fields = ['id', 'author', 'content', 'created_at', 'like_count']
+        fields = ['id', 'author', 'content', 'created_at', 'like_count', 'comment_count']
         read_only_fields = ['author', 'created_at']
-
-    def get_like_count(self, obj):
-        return obj.likes.count()
     
 class CommentSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
@@ -59,40 +64,47 @@ class CommentSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     email = serializers.ReadOnlyField(source='user.email')
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
-    posts_count = serializers.SerializerMethodField()
+    avatar_variants = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
     
     class Meta:
         model = UserProfile
-        fields = ['username', 'email', 'bio', 'avatar', 'created_at', 
+        fields = ['username', 'email', 'bio', 'avatar', 'avatar_variants', 'created_at', 
                  'followers_count', 'following_count', 'posts_count', 'is_following']
-        read_only_fields = ['created_at']
-    
-    def get_followers_count(self, obj):
-        return obj.user.followers.count()
-    
-    def get_following_count(self, obj):
-        return obj.user.following.count()
-    
-    def get_posts_count(self, obj):
-        return obj.user.posts.count()
+        read_only_fields = ['created_at', 'followers_count', 'following_count', 'posts_count']
     
+    def get_avatar_variants(self, obj):
+        return images.variant_urls(obj.avatar_variants, self.context.get('request'))
+
     def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Follow.objects.filter(follower=request.user, following=obj.user).exists()
-        return False
+        if hasattr(obj, 'is_following'):
+            return obj.is_following
+        return queries.is_following(self.context.get('request'), obj.user_id)
 
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username')
     email = serializers.EmailField(source='user.email')
+    # Обычное файловое поле: ни расширение имени, ни Pillow не решают, тип
+    # определяется по содержимому в validate_avatar
+    avatar = serializers.FileField(required=False, allow_null=True)
     
     class Meta:
         model = UserProfile
         fields = ['username', 'email', 'bio', 'avatar']
     
+    def validate_avatar(self, avatar):
+        if not avatar:
+            return avatar
+        # Основной лимит в api.uploads; здесь - на случай других обработчиков загрузки
+        if avatar.size > settings.AVATAR_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError('Avatar file is too large.')
+        extension = uploads.allowed_image_extension(avatar)
+        if extension is None:
+            raise serializers.ValidationError('Unsupported image type.')
+        # Расширение берется из содержимого, имя файла задает хранилище
+        avatar.name = 'avatar' + extension
+        return avatar
+    
     def update(self, instance, validated_data):
         user_data = validated_data.pop('user', {})
         
@@ -104,36 +116,49 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
         
         # Обновление профиля
         instance.bio = validated_data.get('bio', instance.bio)
-        instance.avatar = validated_data.get('avatar', instance.avatar)
+        avatar = validated_data.get('avatar', instance.avatar)
+        previous = None
+        if avatar != instance.avatar:
+            # Варианты старого аватара больше не подходят, новые строятся после коммита
+            previous, instance.avatar_variants = instance.avatar_variants, {}
+        instance.avatar = avatar
         instance.save()
+        if previous is not None and instance.avatar:
+            images.schedule_variants(instance, previous)
+        elif previous:
+            transaction.on_commit(lambda: images.delete_variants(previous))
         
         return instance
 
+class UserListSerializer(serializers.ListSerializer):
+    # Подписки зрителя на всю страницу пользователей загружаются одним запросом,
+    # если список не выбрал их сам (api.queries.user_list/follow_edges с request)
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        queries.remember_following(request, users)
+        queries.prefetch_following(request, [user.pk for user in users])
+        return super().to_representation(users)
+
 class UserSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
-    posts_count = serializers.SerializerMethodField()
+    followers_count = serializers.ReadOnlyField(source='profile.followers_count')
+    following_count = serializers.ReadOnlyField(source='profile.following_count')
+    posts_count = serializers.ReadOnlyField(source='profile.posts_count')
+    avatar_variants = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'date_joined', 
+        fields = ['id', 'username', 'email', 'date_joined', 'avatar_variants',
                  'followers_count', 'following_count', 'posts_count', 'is_following']
+        list_serializer_class = UserListSerializer
     
-    def get_followers_count(self, obj):
-        return obj.followers.count()
-    
-    def get_following_count(self, obj):
-        return obj.following.count()
-    
-    def get_posts_count(self, obj):
-        return obj.posts.count()
+    def get_avatar_variants(self, obj):
+        profile = getattr(obj, 'profile', None)
+        return images.variant_urls(profile.avatar_variants if profile else None, self.context.get('request'))
     
     def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Follow.objects.filter(follower=request.user, following=obj).exists()
-        return False
+        return queries.is_following(self.context.get('request'), obj.pk)
 
 class FollowSerializer(serializers.ModelSerializer):
     follower = serializers.ReadOnlyField(source='follower.username')
@@ -150,10 +175,50 @@ class NotificationSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Notification
-        fields = ['id', 'sender', 'notification_type', 'post_content', 'is_read', 'created_at']
+        fields = ['id', 'sender', 'others_count', 'notification_type', 'post_content', 'is_read', 'created_at']
         read_only_fields = ['created_at']
     
     def get_post_content(self, obj):
         if obj.post:
             return obj.post.content[:50] + '...' if len(obj.post.content) > 50 else obj.post.content
-        return None
\ No newline at end of file
+        return None
+class LikeActionSerializer(serializers.Serializer):
+    post = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+
+class LikeBatchSerializer(serializers.Serializer):
+    actions = LikeActionSerializer(many=True, allow_empty=False)
+
+    def validate_actions(self, actions):
+        max_size = getattr(settings, 'LIKE_BATCH_MAX_SIZE', 100)
+        if len(actions) > max_size:
+            raise serializers.ValidationError(f'No more than {max_size} actions per request.')
+        return actions
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        # Как в simplejwt, но пользователь читается один раз и обновляет claims токенов
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh.payload.get(jwt_settings.USER_ID_CLAIM)).first()
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        refresh['username'] = user.get_username()
+        refresh['is_staff'] = user.is_staff
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
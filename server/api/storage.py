@@ -0,0 +1,102 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+# Хранилище с адресацией по содержимому: имя файла - sha256 его байтов
+# (каталог и расширение берутся из исходного имени). Одинаковые файлы
+# хранятся один раз, а содержимое по имени никогда не меняется, поэтому
+# его можно кешировать навсегда (api.media). Общие файлы учитываются
+# счетчиками ссылок StoredFile: acquire/release, удаление - на нуле.
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(file):
+    # HashingTemporaryFileUploadHandler уже посчитал хеш при загрузке
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = ContentFile(content.read())
+        digest = file_digest(content)
+        directory = posixpath.dirname(name.replace(os.sep, '/'))
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Совпадение имени означает совпадение содержимого - суффикс не нужен
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def digest_from_name(name):
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    if len(stem) == 64 and all(char in '0123456789abcdef' for char in stem):
+        return stem
+    return None
+
+
+def acquire(names):
+    from api.models import StoredFile
+
+    names = list(names)
+    if not names:
+        return
+    StoredFile.objects.bulk_create([StoredFile(name=name) for name in names], ignore_conflicts=True)
+    StoredFile.objects.filter(name__in=names).update(references=F('references') + 1)
+
+
+def release(names):
+    from api.models import StoredFile
+
+    names = list(names)
+    if not names:
+        return
+    with transaction.atomic():
+        StoredFile.objects.filter(name__in=names).update(references=F('references') - 1)
+        unused = list(StoredFile.objects.filter(name__in=names, references__lte=0).values_list('name', flat=True))
+        StoredFile.objects.filter(name__in=unused, references__lte=0).delete()
+    transaction.on_commit(lambda: delete_unreferenced(unused))
+
+
+def delete_unreferenced(names):
+    from api.models import StoredFile
+
+    # Файл мог снова понадобиться, пока удаление ждало коммита
+    names = set(names)
+    if not names:
+        return
+    names -= set(StoredFile.objects.filter(name__in=names, references__gt=0).values_list('name', flat=True))
+    for name in names:
+        content_storage.delete(name)
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from api import pubsub
+from api.tokens import StreamToken
+from api.timeline import fan_out_on_read_authors
+
+# Server-Sent Events: одно долгоживущее соединение вместо опроса /notifications/.
+# Под ASGI соединение - это корутина и очередь, поток на него не занимается.
+
+
+def _authenticate(request):
+    # EventSource в браузере не умеет ставить заголовки, поэтому в ?token= можно
+    # передать одноразовый StreamToken из POST /api/stream/token/ (но не access-токен)
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    try:
+        if raw_token is not None:
+            return auth.get_user(auth.get_validated_token(raw_token))
+        if request.GET.get('token'):
+            token = StreamToken(request.GET['token'])
+            token.use()
+            return auth.get_user(token)
+    except (InvalidToken, AuthenticationFailed, TokenError):
+        return None
+    return None
+
+
+def _format(message):
+    data = json.dumps(message['data'], cls=DjangoJSONEncoder)
+    return f"event: {message['event']}\ndata: {data}\n\n"
+
+
+async def _events(channels):
+    broker = pubsub.get_broker()
+    subscription = broker.subscribe(channels)
+    heartbeat = getattr(settings, 'STREAM_HEARTBEAT', 15)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                yield ': keep-alive\n\n'
+                continue
+            yield _format(message)
+    finally:
+        subscription.close()
+
+
+async def event_stream(request):
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    pull_authors = await sync_to_async(fan_out_on_read_authors)(user)
+    channels = [pubsub.user_channel(user.id)] + [pubsub.author_channel(author_id) for author_id in pull_authors]
+
+    response = StreamingHttpResponse(_events(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
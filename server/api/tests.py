@@ -1,3 +1,1299 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import runpy
+import shutil
+import tempfile
+from array import array
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import checks, instrumentation, likes, middleware, projections, pubsub, queries, throttling, timeline
+
+from api.benchmarking import seed_social_graph
+from api.cache import read_through
+from api.counters import reconcile_counters
+from api.graph import graph as follow_graph
+from api.models import Comment, Follow, Notification, NotificationEvent, Post, StoredFile, TimelineEntry, UserProfile
+from api.notifications import process_outbox
+from api.renderers import FastJSONRenderer
+from api.routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware, use_primary
+from api.serializers import CommentSerializer, NotificationSerializer, PostSerializer, UserSerializer
+from api.tokens import blacklist_cache
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    FOLLOW_GRAPH_ENABLED=False,
+    NOTIFICATIONS_ASYNC=False,
+    AVATAR_PROCESSING_ASYNC=False,
+)
+class BaseTestCase(APITestCase):
+    def setUp(self):
+        # id переиспользуются между тестами, поэтому закешированные ответы и граф сбрасываются
+        cache.clear()
+        follow_graph.reset()
+
+
+class FeedTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'pass12345')
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.client.force_authenticate(self.reader)
+        self.client.post(reverse('follow-user', args=['author']))
+
+    def publish(self, user, content):
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('post-list-create'), {'content': content})
+        self.client.force_authenticate(self.reader)
+        return response.data['id']
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        post_id = self.publish(self.author, 'hello')
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.reader, post_id=post_id).exists())
+
+        response = self.client.get(reverse('feed'))
+        self.assertEqual([p['id'] for p in response.data['results']], [post_id])
+        self.assertIsNone(response.data['next'])
+
+    def test_feed_pages_by_cursor(self):
+        ids = [self.publish(self.author, f'post {i}') for i in range(5)]
+
+        response = self.client.get(reverse('feed'), {'page_size': 2})
+        seen = [p['id'] for p in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [p['id'] for p in response.data['results']]
+
+        self.assertEqual(seen, list(reversed(ids)))
+
+    def test_unfollow_removes_author_from_timeline(self):
+        self.publish(self.author, 'hello')
+        self.client.post(reverse('unfollow-user', args=['author']))
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.reader).exists())
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_high_follower_authors_are_merged_at_read_time(self):
+        old_id = self.publish(self.author, 'pulled')
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        Follow.objects.create(follower=self.author, following=other)
+
+        self.assertFalse(TimelineEntry.objects.filter(post_id=old_id).exists())
+        response = self.client.get(reverse('feed'))
+        self.assertEqual([p['id'] for p in response.data['results']], [old_id])
+
+    @override_settings(FEED_FANOUT_THRESHOLD=2)
+    def test_author_is_pulled_once_followers_reach_threshold(self):
+        second = User.objects.create_user('second', 'second@example.com', 'pass12345')
+        Follow.objects.create(follower=second, following=self.author)
+        post_id = self.publish(self.author, 'pulled')
+
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post_id).exists())
+        response = self.client.get(reverse('feed'))
+        self.assertEqual([p['id'] for p in response.data['results']], [post_id])
+
+    @override_settings(FEED_FANOUT_THRESHOLD=2)
+    def test_pulled_posts_stay_in_feed_after_author_drops_below_threshold(self):
+        second = User.objects.create_user('second', 'second@example.com', 'pass12345')
+        Follow.objects.create(follower=second, following=self.author)
+        post_id = self.publish(self.author, 'pulled')
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post_id).exists())
+
+        self.client.force_authenticate(second)
+        self.client.post(reverse('unfollow-user', args=['author']))
+        self.client.force_authenticate(self.reader)
+
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.reader, post_id=post_id).exists())
+        response = self.client.get(reverse('feed'))
+        self.assertEqual([p['id'] for p in response.data['results']], [post_id])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('feed'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CounterTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass12345')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass12345')
+        self.post = Post.objects.create(author=self.alice, content='hello')
+        self.client.force_authenticate(self.bob)
+
+    def test_like_comment_and_follow_paths_keep_counters(self):
+        self.client.post(reverse('post-like', args=[self.post.id]))
+        self.client.post(reverse('post-comments', args=[self.post.id]), {'content': 'nice'})
+        self.client.post(reverse('follow-user', args=['alice']))
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+        profile = self.alice.profile
+        profile.refresh_from_db()
+        self.assertEqual((profile.followers_count, profile.posts_count), (1, 1))
+
+        self.client.post(reverse('post-unlike', args=[self.post.id]))
+        self.client.post(reverse('unfollow-user', args=['alice']))
+        self.post.refresh_from_db()
+        profile.refresh_from_db()
+        self.assertEqual((self.post.likes_count, profile.followers_count), (0, 0))
+
+    def test_reconcile_counters_fixes_drift(self):
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, comments_count=3)
+        self.assertEqual(reconcile_counters()['Post.likes_count'], 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (0, 0))
+        self.assertEqual(sum(reconcile_counters(dry_run=True).values()), 0)
+
+
+class QueryBudgetTests(BaseTestCase):
+    # Число запросов списка не должно зависеть от числа строк
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'pass12345')
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.post = Post.objects.create(author=self.author, content='root')
+        self.client.force_authenticate(self.viewer)
+
+    def grow(self, rows):
+        start = User.objects.count()
+        for i in range(start, start + rows):
+            user = User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass12345')
+            post = Post.objects.create(author=user, content=f'user post {i}')
+            post.likes.add(self.viewer)
+            Comment.objects.create(post=self.post, author=user, content='comment')
+            Follow.objects.create(follower=user, following=self.author)
+            Follow.objects.create(follower=self.author, following=user)
+            Notification.objects.create(recipient=self.viewer, sender=user, notification_type='like', post=post)
+
+    def assertBudget(self, queries, url, params=None):
+        self.grow(1)
+        with self.assertNumQueries(queries):
+            self.client.get(url, params)
+        self.grow(5)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_list(self):
+        self.assertBudget(1, reverse('post-list-create'))
+
+    def test_user_posts(self):
+        self.assertBudget(2, reverse('user-posts', args=['author']))
+
+    def test_post_comments(self):
+        self.assertBudget(2, reverse('post-comments', args=[self.post.id]))
+
+    def test_followers(self):
+        self.assertBudget(2, reverse('user-followers', args=['author']))
+
+    def test_following(self):
+        self.assertBudget(2, reverse('user-following', args=['author']))
+
+    def test_notifications(self):
+        self.assertBudget(1, reverse('notifications'))
+
+    def test_search(self):
+        self.assertBudget(4, reverse('search'), {'q': 'user'})
+
+
+@override_settings(API_PAGE_SIZE=2, API_MAX_PAGE_SIZE=3)
+class PaginationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.client.force_authenticate(self.author)
+
+    def collect(self, url, params=None):
+        response = self.client.get(url, params)
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data['results'])
+        return pages
+
+    def test_posts_with_equal_timestamps_page_by_id(self):
+        Post.objects.bulk_create([Post(author=self.author, content=str(i)) for i in range(5)])
+        Post.objects.update(created_at=Post.objects.first().created_at)
+
+        pages = self.collect(reverse('post-list-create'))
+        ids = [post['id'] for page in pages for post in page]
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(ids, sorted(Post.objects.values_list('id', flat=True), reverse=True))
+
+    def test_page_size_is_capped(self):
+        Post.objects.bulk_create([Post(author=self.author, content=str(i)) for i in range(5)])
+        response = self.client.get(reverse('post-list-create'), {'page_size': 50})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_followers_page_by_follow_time(self):
+        for i in range(3):
+            follower = User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'pass12345')
+            Follow.objects.create(follower=follower, following=self.author)
+        Follow.objects.create(follower=self.author, following=User.objects.get(username='fan0'))
+
+        pages = self.collect(reverse('user-followers', args=['author']))
+        users = [user for page in pages for user in page]
+        self.assertEqual([user['username'] for user in users], ['fan2', 'fan1', 'fan0'])
+        self.assertEqual([user['is_following'] for user in users], [False, False, True])
+
+
+class SearchTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('searcher', 'searcher@example.com', 'pass12345')
+
+    def search(self, query, **params):
+        return self.client.get(reverse('search'), {'q': query, **params}).data
+
+    def test_posts_are_ranked_by_relevance(self):
+        weak = Post.objects.create(author=self.author, content='django tips and a long tail of unrelated words here')
+        strong = Post.objects.create(author=self.author, content='django django django')
+        Post.objects.create(author=self.author, content='flask')
+
+        self.assertEqual([p['id'] for p in self.search('djang')['posts']], [strong.id, weak.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = Post.objects.create(author=self.author, content='before')
+        post.content = 'after'
+        post.save()
+        self.assertEqual(self.search('before')['posts'], [])
+        self.assertEqual([p['id'] for p in self.search('after')['posts']], [post.id])
+
+        post.delete()
+        self.assertEqual(self.search('after')['posts'], [])
+
+    def test_users_match_substrings_and_results_page(self):
+        Post.objects.bulk_create([Post(author=self.author, content=f'topic {i}') for i in range(3)])
+
+        data = self.search('earch', page_size=2)
+        self.assertEqual([u['username'] for u in data['users']], ['searcher'])
+        self.assertEqual(len(data['posts']), 0)
+
+        data = self.search('topic', page_size=2)
+        self.assertEqual(len(data['posts']), 2)
+        self.assertEqual(len(self.client.get(data['next']).data['posts']), 1)
+
+    def test_raw_queries_use_the_read_database(self):
+        Post.objects.create(author=self.author, content='routed')
+        with mock.patch('api.search.router.db_for_read', return_value='default') as db_for_read:
+            self.assertEqual(len(self.search('routed')['posts']), 1)
+        self.assertIn(mock.call(Post), db_for_read.call_args_list)
+        self.assertIn(mock.call(User), db_for_read.call_args_list)
+
+
+class ResponseCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.fan = User.objects.create_user('fan', 'fan@example.com', 'pass12345')
+        self.post = Post.objects.create(author=self.author, content='cached')
+
+    @override_settings(ALLOWED_HOSTS=['one.example', 'two.example'])
+    def test_absolute_links_are_cached_per_host(self):
+        Post.objects.create(author=self.author, content='older')
+        url = reverse('user-posts', args=['author'])
+        for host in ('one.example', 'two.example'):
+            response = self.client.get(url, {'page_size': 1}, HTTP_HOST=host)
+            self.assertTrue(response.data['next'].startswith(f'http://{host}/'))
+
+    def test_hits_skip_the_database(self):
+        for url in (reverse('post-detail', args=[self.post.id]), reverse('user-posts', args=['author']),
+                    reverse('user-profile', args=['author'])):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.client.get(url)
+
+    def test_likes_invalidate_post_and_author_lists(self):
+        detail = reverse('post-detail', args=[self.post.id])
+        posts = reverse('user-posts', args=['author'])
+        self.client.get(detail)
+        self.client.get(posts)
+
+        self.post.likes.add(self.fan)
+        self.assertEqual(self.client.get(detail).data['like_count'], 1)
+        self.assertEqual(self.client.get(posts).data['results'][0]['like_count'], 1)
+
+    def test_comments_invalidate_author_lists(self):
+        posts = reverse('user-posts', args=['author'])
+        self.client.get(posts)
+
+        comment = Comment.objects.create(post=self.post, author=self.fan, content='first')
+        self.assertEqual(self.client.get(posts).data['results'][0]['comment_count'], 1)
+
+        self.client.force_authenticate(self.fan)
+        self.client.post(reverse('post-comments', args=[self.post.id]), [{'content': 'second'}], format='json')
+        self.assertEqual(self.client.get(posts).data['results'][0]['comment_count'], 2)
+
+        Comment.objects.get(pk=comment.pk).delete()
+        self.assertEqual(self.client.get(posts).data['results'][0]['comment_count'], 1)
+
+    def test_follow_invalidates_profile_and_is_following_is_per_viewer(self):
+        url = reverse('user-profile', args=['author'])
+        self.assertEqual(self.client.get(url).data['followers_count'], 0)
+
+        Follow.objects.create(follower=self.fan, following=self.author)
+        self.client.force_authenticate(self.fan)
+        data = self.client.get(url).data
+        self.assertEqual((data['followers_count'], data['is_following']), (1, True))
+
+        self.client.force_authenticate(None)
+        self.assertFalse(self.client.get(url).data['is_following'])
+
+    def test_expired_entry_is_served_stale_while_another_request_rebuilds(self):
+        builds = []
+
+        def build(deps):
+            deps.pin('post', self.post.id)
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual(read_through('stampede', build, timeout=0), 1)
+        cache.add('lock:stampede', 1)
+        self.assertEqual(read_through('stampede', build, timeout=0), 1)
+        cache.delete('lock:stampede')
+        self.assertEqual(read_through('stampede', build, timeout=0), 2)
+
+
+class NotificationPipelineTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.post = Post.objects.create(author=self.author, content='popular')
+        self.fans = [User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'pass12345') for i in range(3)]
+
+    def test_write_paths_only_enqueue_events(self):
+        self.client.force_authenticate(self.fans[0])
+        self.client.post(reverse('post-like', args=[self.post.id]))
+        self.client.post(reverse('post-comments', args=[self.post.id]), {'content': 'hi'})
+        self.client.post(reverse('follow-user', args=['author']))
+
+        self.assertEqual(NotificationEvent.objects.count(), 3)
+        self.assertFalse(Notification.objects.exists())
+
+        process_outbox()
+        self.assertFalse(NotificationEvent.objects.exists())
+        self.assertEqual(
+            sorted(Notification.objects.values_list('notification_type', flat=True)),
+            ['comment', 'follow', 'like'],
+        )
+
+    def test_like_bursts_are_coalesced(self):
+        for fan in self.fans[:2]:
+            self.post.likes.add(fan)
+        process_outbox()
+        self.post.likes.add(self.fans[2])
+        self.post.likes.add(self.author)
+        process_outbox()
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.sender, notification.others_count), (self.fans[2], 2))
+
+        self.client.force_authenticate(self.author)
+        data = self.client.get(reverse('notifications')).data['results']
+        self.assertEqual((data[0]['sender'], data[0]['others_count']), ('fan2', 2))
+
+    def test_repeat_sender_in_a_later_batch_is_not_counted_again(self):
+        for fan in self.fans[:2]:
+            Comment.objects.create(post=self.post, author=fan, content='first')
+        process_outbox()
+        Comment.objects.create(post=self.post, author=self.fans[0], content='again')
+        process_outbox()
+        Comment.objects.create(post=self.post, author=self.fans[1], content='and again')
+        process_outbox()
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.sender, notification.others_count), (self.fans[1], 1))
+
+    def test_unrelated_unread_notifications_are_not_loaded(self):
+        other_posts = Post.objects.bulk_create(Post(author=self.author, content=f'old {i}') for i in range(30))
+        Notification.objects.bulk_create(
+            Notification(recipient=self.author, sender=self.fans[2], notification_type='like', post=post)
+            for post in other_posts
+        )
+        self.post.likes.add(self.fans[0])
+        process_outbox()
+        self.post.likes.add(self.fans[1])
+
+        with mock.patch.object(Notification, 'from_db', wraps=Notification.from_db) as loaded:
+            process_outbox()
+        self.assertEqual(loaded.call_count, 1)
+        notification = Notification.objects.get(post=self.post)
+        self.assertEqual((notification.sender, notification.others_count), (self.fans[1], 1))
+
+    @override_settings(NOTIFICATION_MAX_SENDER_IDS=2)
+    def test_stored_sender_ids_are_capped(self):
+        for fan in self.fans:
+            self.post.likes.add(fan)
+            process_outbox()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.sender_ids, [self.fans[0].id, self.fans[1].id])
+        self.assertEqual((notification.sender, notification.others_count), (self.fans[2], 2))
+
+
+class EventStreamTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'pass12345')
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        Follow.objects.create(follower=self.reader, following=self.author)
+        self.token = str(AccessToken.for_user(self.reader))
+
+    def stream_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = self.client.post(reverse('stream-token'))
+        self.client.credentials()
+        return response.data['token']
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get(reverse('event-stream')).status_code, 401)
+
+    def test_query_token_is_single_use_and_not_an_access_token(self):
+        url = reverse('event-stream')
+        self.assertEqual(self.client.get(url, {'token': self.token}).status_code, 401)
+
+        token = self.stream_token()
+        response = self.client.get(url, {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        response.close()
+        self.assertEqual(self.client.get(url, {'token': token}).status_code, 401)
+
+        # Токен потока не годится для остального API
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(reverse('notifications')).status_code, 401)
+
+    async def test_pushes_feed_items_and_notifications(self):
+        token = await sync_to_async(self.stream_token)()
+        response = await self.async_client.get(reverse('event-stream'), {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        def publish_post():
+            with self.captureOnCommitCallbacks(execute=True):
+                timeline.fan_out_post(Post.objects.create(author=self.author, content='live'))
+
+        await sync_to_async(publish_post)()
+        await sync_to_async(pubsub.publish)(pubsub.user_channel(self.reader.id), 'notification', {'id': 1})
+
+        feed = await asyncio.wait_for(anext(stream), 1)
+        self.assertTrue(feed.startswith(b'event: feed\n'))
+        self.assertIn(b'"content": "live"', feed)
+        notification = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(notification, b'event: notification\ndata: {"id": 1}\n\n')
+        await response.streaming_content.aclose()
+
+
+class AsyncViewTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'pass12345')
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.client.force_authenticate(self.reader)
+        self.client.post(reverse('follow-user', args=['author']))
+        for i in range(3):
+            post = Post.objects.create(author=self.author, content=f'post {i}')
+            timeline.fan_out_post(post)
+        Notification.objects.create(recipient=self.reader, sender=self.author, notification_type='follow')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.reader)}'}
+
+    async def test_async_views_match_sync_views(self):
+        pairs = [
+            ('post-list-create', 'async-post-list', []),
+            ('feed', 'async-feed', []),
+            ('notifications', 'async-notifications', []),
+            ('user-profile', 'async-user-profile', ['author']),
+        ]
+        for sync_name, async_name, args in pairs:
+            expected = await sync_to_async(self.client.get)(reverse(sync_name, args=args), {'page_size': 2})
+            response = await self.async_client.get(reverse(async_name, args=args), {'page_size': 2}, headers=self.auth)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                json.loads(response.content.replace(b'async/', b'')),
+                json.loads(expected.content),
+                async_name,
+            )
+
+    async def test_async_feed_requires_authentication(self):
+        response = await self.async_client.get(reverse('async-feed'))
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(reverse('async-user-profile', args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+
+
+class FollowLookupTests(BaseTestCase):
+    def test_is_following_is_resolved_once_per_page(self):
+        viewer = User.objects.create_user('viewer', 'viewer@example.com', 'pass12345')
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass12345') for i in range(4)]
+        Follow.objects.create(follower=viewer, following=users[1])
+        Follow.objects.create(follower=viewer, following=users[3])
+        request = self.client.get(reverse('post-list-create')).wsgi_request
+        request.user = viewer
+        page = list(User.objects.filter(pk__in=[u.pk for u in users]).select_related('profile').order_by('id'))
+
+        with self.assertNumQueries(1):
+            data = UserSerializer(page, many=True, context={'request': request}).data
+            self.assertTrue(queries.is_following(request, users[3].pk))
+        self.assertEqual([user['is_following'] for user in data], [False, True, False, True])
+
+
+@override_settings(FOLLOW_GRAPH_ENABLED=True)
+class FollowGraphTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = {
+            name: User.objects.create_user(name, f'{name}@example.com', 'pass12345')
+            for name in ['ann', 'bob', 'cid', 'dan']
+        }
+
+    def follow(self, follower, following):
+        self.client.force_authenticate(self.users[follower])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('follow-user', args=[following]))
+
+    def test_graph_follows_commits(self):
+        follow_graph.following(self.users['ann'].pk)
+        self.follow('ann', 'bob')
+        self.follow('bob', 'ann')
+        self.follow('ann', 'cid')
+        ann, bob = self.users['ann'].pk, self.users['bob'].pk
+        self.assertTrue(follow_graph.is_following(ann, bob))
+        self.assertEqual(follow_graph.mutuals(ann), [bob])
+
+        self.client.force_authenticate(self.users['ann'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('unfollow-user', args=['bob']))
+        self.assertFalse(follow_graph.is_following(ann, bob))
+        self.assertEqual(follow_graph.mutuals(ann), [])
+
+    def test_mutuals_and_suggestions(self):
+        self.follow('ann', 'bob')
+        self.follow('bob', 'ann')
+        self.follow('bob', 'cid')
+        self.follow('bob', 'dan')
+        self.follow('cid', 'dan')
+        self.follow('ann', 'cid')
+
+        # Из графа и без него (запросом к БД) ответы одинаковые
+        for enabled in (True, False):
+            with self.subTest(enabled=enabled), self.settings(FOLLOW_GRAPH_ENABLED=enabled):
+                self.client.force_authenticate(None)
+                response = self.client.get(reverse('user-mutuals', args=['ann']))
+                self.assertEqual([user['username'] for user in response.data['results']], ['bob'])
+
+                self.client.force_authenticate(self.users['ann'])
+                response = self.client.get(reverse('suggestions'))
+                self.assertEqual([user['username'] for user in response.data['results']], ['dan'])
+
+    def test_is_following_reads_the_database(self):
+        # Граф загружен до подписки и о ней не знает (как в другом процессе)
+        follow_graph.following(self.users['ann'].pk)
+        Follow.objects.create(follower=self.users['ann'], following=self.users['bob'])
+        request = self.client.get(reverse('post-list-create')).wsgi_request
+        request.user = self.users['ann']
+        self.assertTrue(queries.is_following(request, self.users['bob'].pk))
+
+    def test_reload_keeps_changes_made_while_it_runs(self):
+        ann, bob, cid = (self.users[name].pk for name in ['ann', 'bob', 'cid'])
+        follow_graph.following(ann)
+
+        def read():
+            # Подписка, закоммиченная во время перезагрузки, в снимок не попала
+            follow_graph.add(ann, cid)
+            return {bob: array('q', [ann])}, {ann: array('q', [bob])}
+
+        with mock.patch.object(follow_graph, '_read', side_effect=read):
+            follow_graph.reload_in_background().join()
+        self.assertEqual(list(follow_graph.following(ann)), [bob, cid])
+
+    @override_settings(FOLLOW_GRAPH_MAX_AGE=0)
+    def test_expired_graph_is_served_while_reloading(self):
+        follow_graph.following(self.users['ann'].pk)
+        with mock.patch.object(follow_graph, 'reload_in_background') as reload:
+            with self.assertNumQueries(0):
+                follow_graph.mutuals(self.users['ann'].pk)
+        reload.assert_called_with()
+
+
+
+class LikeTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.fan = User.objects.create_user('fan', 'fan@example.com', 'pass12345')
+        self.posts = [Post.objects.create(author=self.author, content=f'post {i}') for i in range(3)]
+        self.client.force_authenticate(self.fan)
+
+    def likes_counts(self):
+        return list(Post.objects.filter(pk__in=[p.pk for p in self.posts]).order_by('id').values_list('likes_count', flat=True))
+
+    def test_like_and_unlike_are_idempotent(self):
+        post = self.posts[0]
+        self.assertEqual(self.client.post(reverse('post-like', args=[post.pk])).status_code, 201)
+        response = self.client.post(reverse('post-like', args=[post.pk]))
+        self.assertEqual(response.data['detail'], 'You already liked this post.')
+        self.assertEqual(likes.like(self.fan, [post.pk, post.pk]), [])
+        self.assertEqual(self.likes_counts(), [1, 0, 0])
+        self.assertEqual(NotificationEvent.objects.filter(notification_type='like').count(), 1)
+
+        self.assertEqual(self.client.post(reverse('post-unlike', args=[post.pk])).status_code, 200)
+        response = self.client.post(reverse('post-unlike', args=[post.pk]))
+        self.assertEqual(response.data['detail'], 'You have not liked this post.')
+        self.assertEqual(self.likes_counts(), [0, 0, 0])
+
+    def test_batch_applies_last_action_per_post(self):
+        self.posts[2].likes.add(self.fan)
+        response = self.client.post(reverse('post-like-batch'), {'actions': [
+            {'post': self.posts[0].pk, 'action': 'like'},
+            {'post': self.posts[1].pk, 'action': 'like'},
+            {'post': self.posts[1].pk, 'action': 'unlike'},
+            {'post': self.posts[2].pk, 'action': 'unlike'},
+            {'post': 0, 'action': 'like'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['post'], item['action'], item['result']) for item in response.data['results']],
+            [
+                (self.posts[0].pk, 'like', 'applied'),
+                (self.posts[1].pk, 'unlike', 'unchanged'),
+                (self.posts[2].pk, 'unlike', 'applied'),
+                (0, 'like', 'not_found'),
+            ],
+        )
+        self.assertEqual(self.likes_counts(), [1, 0, 0])
+
+    @override_settings(LIKE_BATCH_MAX_SIZE=2)
+    def test_batch_size_is_capped(self):
+        actions = [{'post': post.pk, 'action': 'like'} for post in self.posts]
+        response = self.client.post(reverse('post-like-batch'), {'actions': actions}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.likes_counts(), [0, 0, 0])
+
+
+class BulkCreateTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'pass12345')
+        Follow.objects.create(follower=self.reader, following=self.author)
+        self.client.force_authenticate(self.author)
+
+    def test_posts_are_created_in_one_batch(self):
+        items = [{'content': f'post {i}'} for i in range(5)]
+        # Число запросов не зависит от размера пачки
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('post-list-create'), items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([post['content'] for post in response.data], [item['content'] for item in items])
+        self.assertEqual(UserProfile.objects.get(user=self.author).posts_count, 5)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 5)
+
+    def test_invalid_item_rejects_whole_batch(self):
+        response = self.client.post(reverse('post-list-create'), [{'content': 'ok'}, {'content': ''}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('content', response.data[1])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(BULK_CREATE_MAX_SIZE=2)
+    def test_batch_size_is_capped(self):
+        response = self.client.post(reverse('post-list-create'), [{'content': 'x'}] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_empty_batch_is_rejected(self):
+        post = Post.objects.create(author=self.author, content='hello')
+        for url in (reverse('post-list-create'), reverse('post-comments', args=[post.pk])):
+            response = self.client.post(url, [], format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_comments_are_created_in_one_batch(self):
+        post = Post.objects.create(author=self.author, content='hello')
+        self.client.force_authenticate(self.reader)
+        response = self.client.post(
+            reverse('post-comments', args=[post.pk]),
+            [{'content': 'first'}, {'content': 'second'}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(NotificationEvent.objects.filter(notification_type='comment').count(), 1)
+
+
+class AvatarVariantTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('ann', 'ann@example.com', 'pass12345')
+        self.client.force_authenticate(self.user)
+
+    def image(self, color, image_format='PNG'):
+        buffer = BytesIO()
+        Image.new('RGBA' if image_format == 'PNG' else 'RGB', (800, 600), color).save(buffer, image_format)
+        return buffer.getvalue()
+
+    def put_avatar(self, user, data, name='avatar.png'):
+        self.client.force_authenticate(user)
+        avatar = SimpleUploadedFile(name, data, content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(
+                reverse('profile'),
+                {'username': user.username, 'email': user.email, 'bio': '', 'avatar': avatar},
+                format='multipart',
+            )
+
+    def upload(self, color):
+        response = self.put_avatar(self.user, self.image(color))
+        self.assertEqual(response.status_code, 200)
+        return UserProfile.objects.get(user=self.user).avatar_variants
+
+    def test_upload_builds_variants(self):
+        variants = self.upload((255, 0, 0, 128))
+        self.assertEqual(sorted(variants), ['256', '64'])
+        for size, formats in variants.items():
+            self.assertEqual(sorted(formats), ['jpeg', 'webp'])
+            with default_storage.open(formats['webp']) as f:
+                self.assertEqual(Image.open(f).size, (int(size), int(size)))
+
+        data = self.client.get(reverse('user-profile', args=['ann'])).data
+        self.assertTrue(data['avatar_variants']['64']['webp'].endswith(variants['64']['webp']))
+
+        # Новый аватар заменяет варианты старого и удаляет их файлы
+        replaced = self.upload('blue')
+        self.assertFalse(default_storage.exists(variants['64']['jpeg']))
+        self.assertTrue(default_storage.exists(replaced['64']['jpeg']))
+
+    def test_backfill_command(self):
+        variants = self.upload('green')
+        UserProfile.objects.filter(user=self.user).update(avatar_variants={})
+        call_command('build_avatar_variants', workers=1, stdout=StringIO())
+        rebuilt = UserProfile.objects.get(user=self.user).avatar_variants
+        self.assertEqual(sorted(rebuilt), sorted(variants))
+
+    def test_identical_avatars_share_one_file(self):
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pass12345')
+        self.upload('red')
+        # Тип определяется по содержимому: JPEG с расширением .png сохраняется как .jpg
+        self.put_avatar(bob, self.image('red', 'JPEG'), name='photo.png')
+        self.put_avatar(bob, self.image('red'))
+        ann_profile, bob_profile = UserProfile.objects.get(user=self.user), UserProfile.objects.get(user=bob)
+        self.assertEqual(ann_profile.avatar.name, bob_profile.avatar.name)
+        self.assertEqual(ann_profile.avatar_variants, bob_profile.avatar_variants)
+        self.assertRegex(ann_profile.avatar.name, r'^avatars/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(len(os.listdir(os.path.dirname(ann_profile.avatar.path))), 1)
+        # Общие варианты не удаляются, пока на них ссылается другой профиль
+        self.assertTrue(default_storage.exists(ann_profile.avatar_variants['64']['webp']))
+
+    def test_shared_variants_are_deleted_with_the_last_reference(self):
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pass12345')
+        path = self.upload('red')['64']['webp']
+        self.put_avatar(bob, self.image('red'))
+        self.assertEqual(StoredFile.objects.get(name=path).references, 2)
+
+        self.put_avatar(bob, self.image('blue'))
+        self.assertTrue(default_storage.exists(path))
+        self.upload('green')
+        self.assertFalse(default_storage.exists(path))
+        self.assertFalse(StoredFile.objects.filter(name=path).exists())
+
+        blue = UserProfile.objects.get(user=bob).avatar_variants['64']['webp']
+        with self.captureOnCommitCallbacks(execute=True):
+            bob.delete()
+        self.assertFalse(default_storage.exists(blue))
+
+    def test_content_type_is_sniffed(self):
+        # Настоящий WebP под видом .jpg: Pillow его откроет, но тип не из ALLOWED_IMAGE_EXTENSIONS
+        response = self.put_avatar(self.user, self.image('red', 'WEBP'), name='avatar.jpg')
+        self.assertEqual(response.data['avatar'], ['Unsupported image type.'])
+        response = self.put_avatar(self.user, b'<svg xmlns="http://www.w3.org/2000/svg"/>', name='avatar.png')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserProfile.objects.get(user=self.user).avatar)
+
+    def test_file_name_extension_does_not_matter(self):
+        response = self.put_avatar(self.user, self.image('red'), name='avatar.bin')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(UserProfile.objects.get(user=self.user).avatar.name.endswith('.png'))
+
+    def test_oversized_upload_is_stopped_by_the_upload_handler(self):
+        with override_settings(AVATAR_MAX_UPLOAD_SIZE=1024), \
+                mock.patch('api.serializers.UserProfileUpdateSerializer.validate_avatar') as validate:
+            response = self.put_avatar(self.user, self.image('red'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too large', response.data['detail'])
+        validate.assert_not_called()
+        self.assertFalse(UserProfile.objects.get(user=self.user).avatar)
+
+    def test_media_is_served_immutable_with_etag(self):
+        self.upload('red')
+        name = UserProfile.objects.get(user=self.user).avatar.name
+        url = reverse('media', args=[name])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{os.path.splitext(os.path.basename(name))[0]}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+
+class ConditionalGetTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.fan = User.objects.create_user('fan', 'fan@example.com', 'pass12345')
+        self.post = Post.objects.create(author=self.author, content='hello')
+        self.client.force_authenticate(self.fan)
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return etag, self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_post_list_and_detail_revalidate(self):
+        list_url, detail_url = reverse('post-list-create'), reverse('post-detail', args=[self.post.pk])
+        list_etag, response = self.revalidate(list_url)
+        self.assertEqual((response.status_code, response['ETag']), (304, list_etag))
+        detail_etag, response = self.revalidate(detail_url)
+        self.assertEqual((response.status_code, response['ETag']), (304, detail_etag))
+
+        # Лайк увеличивает версию поста, и старый ETag больше не совпадает
+        self.post.likes.add(self.fan)
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.data['results'][0]['like_count'], 1)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.data['like_count'], 1)
+
+    def test_comments_304_skips_the_page_query(self):
+        url = reverse('post-comments', args=[self.post.pk])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Comment.objects.create(post=self.post, author=self.fan, content='first')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_comments_revalidate_after_commenter_rename(self):
+        Comment.objects.create(post=self.post, author=self.fan, content='first')
+        url = reverse('post-comments', args=[self.post.pk])
+        etag, response = self.revalidate(url)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put(reverse('profile'), {'username': 'renamed', 'email': self.fan.email, 'bio': ''})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['author'], 'renamed')
+
+    def test_profile_etag_follows_the_viewer(self):
+        url = reverse('user-profile', args=['author'])
+        etag, response = self.revalidate(url)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('private', response['Cache-Control'])
+        self.client.post(reverse('follow-user', args=['author']))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_following'])
+
+    def test_feed_revalidates(self):
+        self.client.post(reverse('follow-user', args=['author']))
+        etag, response = self.revalidate(reverse('feed'))
+        self.assertEqual(response.status_code, 304)
+        self.client.force_authenticate(self.author)
+        self.client.post(reverse('post-list-create'), {'content': 'news'})
+        self.client.force_authenticate(self.fan)
+        self.assertEqual(self.client.get(reverse('feed'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class RenderingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        Post.objects.bulk_create([Post(author=self.author, content=f'post {i}   текст') for i in range(30)])
+
+    def test_fast_renderer_matches_drf_output(self):
+        data = PostSerializer(queries.post_list(), many=True).data
+        data.append({'price': Decimal('1.50'), 'at': timezone.now(), 3: None})
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with override_settings(JSON_BACKEND='json'):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_fast_parser_reports_errors(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(reverse('post-list-create'), '{"content": "ok"', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.data['detail'])
+
+    def test_large_responses_are_compressed(self):
+        url = reverse('post-list-create') + '?page_size=30'
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=1.0, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        with override_settings(COMPRESSION_MIN_SIZE=len(plain.content) + 1):
+            self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING='gzip'))
+
+    @skipUnless(middleware.brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.client.get(reverse('post-list-create') + '?page_size=30', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+
+class ProjectionTests(BaseTestCase):
+    # Быстрые словари должны совпадать с выводом сериализаторов поле в поле
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        self.fan = User.objects.create_user('fan', 'fan@example.com', 'pass12345')
+        self.long_post = Post.objects.create(author=self.author, content='x' * 80)
+        self.short_post = Post.objects.create(author=self.author, content='short')
+        self.long_post.likes.add(self.fan)
+        Comment.objects.create(post=self.long_post, author=self.fan, content='nice')
+        Notification.objects.create(recipient=self.author, sender=self.fan, notification_type='like', post=self.long_post)
+        Notification.objects.create(recipient=self.author, sender=self.fan, notification_type='like', post=self.short_post)
+        Notification.objects.create(recipient=self.author, sender=self.fan, notification_type='follow', others_count=2)
+
+    def test_posts_match_serializer(self):
+        posts = Post.objects.select_related('author').order_by('id')
+        self.assertEqual(
+            projections.post_data(projections.post_rows().order_by('id')),
+            PostSerializer(posts, many=True).data,
+        )
+
+    def test_comments_match_serializer(self):
+        comments = Comment.objects.select_related('author').order_by('id')
+        self.assertEqual(
+            projections.comment_data(projections.comment_rows(self.long_post).order_by('id')),
+            CommentSerializer(comments, many=True).data,
+        )
+
+    def test_notifications_match_serializer(self):
+        notifications = Notification.objects.select_related('sender', 'post').order_by('id')
+        self.assertEqual(
+            projections.notification_data(projections.notification_rows(self.author).order_by('id')),
+            NotificationSerializer(notifications, many=True).data,
+        )
+
+
+@override_settings(PERF_SAMPLE_RATE=1.0)
+class InstrumentationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        instrumentation.registry.reset()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass12345')
+        Post.objects.bulk_create([Post(author=self.author, content=f'post {i}') for i in range(3)])
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse('post-list-create'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, serialize;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+
+        self.assertEqual(self.client.get(reverse('internal-metrics')).status_code, 401)
+        admin = User.objects.create_user('admin', 'admin@example.com', 'pass12345', is_staff=True)
+        self.client.force_authenticate(admin)
+        stats = self.client.get(reverse('internal-metrics')).data['views']['post-list-create']
+        self.assertEqual(stats['count'], 1)
+        self.assertGreater(stats['queries']['sum'], 0)
+        self.assertEqual(stats['bytes'], len(response.content))
+        self.assertIn('serialize_ms', stats)
+
+        # Фаза serialize есть и у деталей: при построении записи кеша
+        post = Post.objects.first()
+        for url in (reverse('post-detail', args=[post.pk]), reverse('user-profile', args=['author'])):
+            self.assertIn('serialize;dur=', self.client.get(url)['Server-Timing'])
+
+        self.client.delete(reverse('internal-metrics'))
+        self.assertNotIn('post-list-create', instrumentation.registry.snapshot())
+
+    def test_sampling_off_adds_nothing(self):
+        with override_settings(PERF_SAMPLE_RATE=0.0):
+            response = self.client.get(reverse('post-list-create'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.registry.snapshot(), {})
+
+    def test_repeated_sql_shape_is_flagged(self):
+        self.assertEqual(
+            instrumentation.sql_shape('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            instrumentation.sql_shape('SELECT * FROM "t" WHERE "id" IN (%s) LIMIT 5'),
+        )
+        with override_settings(PERF_N_PLUS_ONE_THRESHOLD=1), self.assertLogs('api.instrumentation', 'WARNING'):
+            self.client.get(reverse('post-list-create'))
+        stats = instrumentation.registry.snapshot()['post-list-create']
+        self.assertEqual(stats['n_plus_one'], 1)
+        self.assertIn('SELECT', stats['last_n_plus_one']['sql'])
+
+    async def test_async_views_are_measured(self):
+        response = await self.async_client.get(reverse('async-post-list'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+
+class BenchmarkToolTests(BaseTestCase):
+    def test_seeder_skews_popularity(self):
+        stats = seed_social_graph(200, 1000, follows=2000, likes=3000, comments=500, notifications=100, seed=7)
+        self.assertEqual(stats['users'], 200)
+        self.assertEqual(stats['posts'], 1000)
+        self.assertGreater(stats['follows'], 0)
+        self.assertLessEqual(stats['follows'], 2000)
+
+        followers = sorted(UserProfile.objects.values_list('followers_count', flat=True), reverse=True)
+        self.assertEqual(sum(followers), stats['follows'])
+        # Закон Ципфа: у самого популярного в разы больше подписчиков, чем у медианного
+        self.assertGreater(followers[0], 10 * max(1, followers[len(followers) // 2]))
+        self.assertEqual(sum(Post.objects.values_list('likes_count', flat=True)), stats['likes'])
+
+    def test_endpoint_bench_fails_on_regression(self):
+        seed_social_graph(30, 100, follows=100, likes=100, comments=50, notifications=20, seed=1)
+        baseline = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(baseline))
+        out = StringIO()
+        call_command('bench_endpoints', requests=1, warmup=0, only=['post-list-create', 'feed'],
+                     save_baseline=baseline, stdout=out)
+        self.assertIn('GET feed', out.getvalue())
+        self.assertEqual(Post.objects.count(), 100)
+
+        with open(baseline) as f:
+            results = json.load(f)
+        self.assertGreater(results['GET post-list-create']['queries'], 0)
+        self.assertEqual(results['POST post-list-create']['errors'], 0)
+        results['GET post-list-create']['queries'] -= 1
+        with open(baseline, 'w') as f:
+            json.dump(results, f)
+        with self.assertRaisesMessage(CommandError, 'regression'):
+            call_command('bench_endpoints', requests=1, warmup=0, only=['post-list-create'],
+                         baseline=baseline, tolerance=1000, stdout=StringIO())
+
+
+class SQLiteSettingsTests(SimpleTestCase):
+    def test_wal_mode_options_and_pragmas(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        env = {'DB_ENGINE': 'sqlite', 'DB_SQLITE_WAL': '1', 'DB_NAME': os.path.join(directory, 'wal.sqlite3')}
+        with mock.patch.dict(os.environ, env):
+            config = runpy.run_path(importlib.import_module(settings.SETTINGS_MODULE).__file__)['DATABASES']['default']
+
+        options = config['OPTIONS']
+        self.assertEqual((options['timeout'], options['transaction_mode']), (20, 'IMMEDIATE'))
+        self.assertIn('PRAGMA journal_mode=WAL;', options['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL;', options['init_command'])
+
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        wrapper = DatabaseWrapper({**settings.DATABASES['default'], **config}, alias='wal')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in ('journal_mode', 'synchronous', 'busy_timeout')]
+        self.assertEqual(pragmas, ['wal', 1, 20000])
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    # Без базы: внутри транзакции TestCase роутер всегда выбирал бы default
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = User(pk=42, username='writer')
+
+    def route(self, method, user=None):
+        def view(request):
+            # Так DRF передает аутентифицированного пользователя в HttpRequest
+            if user is not None:
+                request.user = user
+            response = HttpResponse(self.router.db_for_read(Post))
+            with use_primary():
+                response['X-Primary'] = self.router.db_for_read(Post)
+            return response
+
+        request = getattr(RequestFactory(), method)('/api/posts/')
+        request.user = SimpleLazyObject(lambda: AnonymousUser())
+        return ReplicaRoutingMiddleware(view)(request)
+
+    def test_reads_go_to_replica_only_in_safe_requests(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        response = self.route('get')
+        self.assertEqual(response.content, b'replica1')
+        self.assertEqual(response['X-Primary'], 'default')
+        self.assertEqual(self.route('post').content, b'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_writer_reads_own_writes_from_primary(self):
+        self.assertEqual(self.route('get', self.user).content, b'replica1')
+        self.route('post', self.user)
+        self.assertEqual(self.route('get', self.user).content, b'default')
+        self.assertEqual(self.route('get', User(pk=7, username='other')).content, b'replica1')
+        self.assertEqual(self.route('get').content, b'replica1')
+
+
+class TokenAuthTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        blacklist_cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'pass12345')
+        self.staff = User.objects.create_user('admin', 'admin@example.com', 'pass12345', is_staff=True)
+        Notification.objects.create(recipient=self.user, sender=self.staff, notification_type='follow')
+
+    def login(self, username):
+        response = self.client.post(reverse('login'), {'username': username, 'password': 'pass12345'})
+        return response.data
+
+    def test_reads_do_not_load_the_user(self):
+        tokens = self.login('reader')
+        # Только сам список - как с force_authenticate, без чтения User
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('notifications'), headers={'Authorization': f"Bearer {tokens['access']}"})
+        self.assertEqual(len(response.data['results']), 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('profile'), headers={'Authorization': f"Bearer {tokens['access']}"})
+        self.assertEqual(response.data['username'], 'reader')
+
+    def test_writes_check_the_user(self):
+        access = self.login('reader')['access']
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        headers = {'Authorization': f'Bearer {access}'}
+        self.assertEqual(self.client.post(reverse('post-list-create'), {'content': 'x'}, headers=headers).status_code, 401)
+        self.assertEqual(self.client.get(reverse('feed'), headers=headers).status_code, 200)
+
+    def test_staff_is_checked_against_the_database(self):
+        headers = {'Authorization': f"Bearer {self.login('admin')['access']}"}
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('internal-metrics'), headers=headers).status_code, 200)
+        # Claim is_staff в токене остается, но права уже сняты
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.assertEqual(self.client.get(reverse('internal-metrics'), headers=headers).status_code, 403)
+        headers = {'Authorization': f"Bearer {self.login('reader')['access']}"}
+        self.assertEqual(self.client.get(reverse('internal-metrics'), headers=headers).status_code, 403)
+
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        refresh = self.login('reader')['refresh']
+        rotated = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(rotated.status_code, 200)
+        self.assertEqual(AccessToken(rotated.data['access'])['username'], 'reader')
+
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': refresh}).status_code, 401)
+        # Отозванный токен запоминается до своего exp - повтор без запросов к БД
+        blacklist_cache.clear()
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': refresh}).status_code, 401)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': refresh}).status_code, 401)
+
+        access = rotated.data['access']
+        response = self.client.post(reverse('logout'), {'refresh': rotated.data['refresh']},
+                                    headers={'Authorization': f'Bearer {access}'})
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': rotated.data['refresh']}).status_code, 401)
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'search': '3/min', 'comments': '2/min', 'register': '1/h', 'likes': '2/10s'},
+})
+class ThrottleTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'pass12345')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        self.post = Post.objects.create(author=self.other, content='post')
+
+    def test_limit_per_user_with_headers(self):
+        self.client.force_authenticate(self.user)
+        remaining = [self.client.get(reverse('search'), {'q': 'post'})['RateLimit-Remaining'] for _ in range(3)]
+        self.assertEqual(remaining, ['2', '1', '0'])
+
+        response = self.client.get(reverse('search'), {'q': 'post'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['RateLimit-Limit'], '3')
+        self.assertEqual(response['RateLimit-Remaining'], '0')
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # Другой пользователь и аноним (по IP) считаются отдельно
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'post'}).status_code, 200)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'post'}).status_code, 200)
+
+    def test_scope_per_method_and_ip_scopes(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('post-comments', args=[self.post.pk])
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {'content': 'hi'}).status_code, 201)
+        self.assertEqual(self.client.post(url, {'content': 'hi'}).status_code, 429)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('RateLimit-Limit', response)
+
+        # Регистрация считается по IP, даже если запрос пришел с токеном
+        data = {'username': 'new1', 'email': 'new1@example.com', 'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!'}
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, 201)
+        self.client.force_authenticate(self.other)
+        data.update(username='new2', email='new2@example.com')
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, 429)
+
+        with override_settings(THROTTLE_ENABLED=False):
+            self.assertEqual(self.client.post(reverse('register'), data).status_code, 201)
+
+    def test_sliding_window(self):
+        self.client.force_authenticate(self.user)
+        clock = mock.Mock()
+        url = reverse('post-like', args=[self.post.pk])
+        unlike = reverse('post-unlike', args=[self.post.pk])
+        with mock.patch.object(throttling, 'time', clock):
+            clock.time.return_value = 100.0
+            self.assertEqual(self.client.post(url).status_code, 201)
+            self.assertEqual(self.client.post(unlike).status_code, 200)
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '10')
+
+            # Середина следующего окна: предыдущее весит половину (2 * 0.5 + 1 <= 2)
+            clock.time.return_value = 115.0
+            self.assertEqual(self.client.post(url).status_code, 201)
+            response = self.client.post(unlike)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '5')
+
+            clock.time.return_value = 120.0
+            self.assertEqual(self.client.post(unlike).status_code, 200)
+
+    def test_non_atomic_cache_fails_the_system_check(self):
+        self.assertEqual(checks.check_throttle_cache(None), [])
+        file_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(),
+        }}
+        self.addCleanup(shutil.rmtree, file_cache['default']['LOCATION'], ignore_errors=True)
+        with override_settings(CACHES=file_cache):
+            self.assertEqual([error.id for error in checks.check_throttle_cache(None)], ['api.E001'])
+            with override_settings(THROTTLE_ENABLED=False):
+                self.assertEqual(checks.check_throttle_cache(None), [])
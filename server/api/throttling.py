@@ -0,0 +1,99 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Ограничение частоты по скользящему окну из двух счетчиков: текущее окно
+# считается точно, предыдущее - пропорционально еще не ушедшей его части.
+# Состояние - два целых в кеше, на запрос два обращения (incr + get); incr
+# атомарен в memcached/redis, поэтому при нескольких процессах нужен общий
+# кеш. Вью задает throttle_scope (строку или {метод: scope}), лимиты -
+# REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], например '30/min' или '5/10s'.
+# Ключ - пользователь, анонимы и scope из THROTTLE_IP_SCOPES - по IP.
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    # '30/min' -> (30, 60), '5/10s' -> (5, 10)
+    count, _, period = rate.partition('/')
+    digits = ''.join(ch for ch in period if ch.isdigit())
+    unit = period[len(digits):][:1]
+    if unit not in PERIODS:
+        raise ImproperlyConfigured(f'Invalid throttle rate "{rate}"')
+    return int(count), int(digits or 1) * PERIODS[unit]
+
+
+def _incr(key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if isinstance(scope, dict):
+            return scope.get(request.method)
+        return scope
+
+    def get_ident_key(self, request, scope):
+        user = request.user
+        if user.is_authenticated and scope not in getattr(settings, 'THROTTLE_IP_SCOPES', ()):
+            return f'user:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+
+        limit, duration = parse_rate(rate)
+        now = time.time()
+        window = int(now // duration)
+        elapsed = now - window * duration
+        prefix = f'throttle:{scope}:{self.get_ident_key(request, scope)}'
+        current_key = f'{prefix}:{window}'
+
+        current = _incr(current_key, duration * 2)
+        previous = cache.get(f'{prefix}:{window - 1}', 0)
+        weight = 1 - elapsed / duration
+        used = previous * weight + current
+
+        if used > limit:
+            # Отклоненный запрос не должен продлевать блокировку
+            cache.decr(current_key)
+            current -= 1
+            if current >= limit or previous == 0:
+                # Текущее окно заполнено само по себе - до его конца
+                self.wait_time = duration - elapsed
+            else:
+                # Ждем, пока вклад предыдущего окна упадет настолько, чтобы запрос прошел
+                self.wait_time = min(duration - elapsed, (previous * weight + current + 1 - limit) * duration / previous)
+            self.record(request, limit, 0, self.wait_time)
+            return False
+
+        self.record(request, limit, max(0, math.floor(limit - used)), duration - elapsed)
+        return True
+
+    def record(self, request, limit, remaining, reset):
+        # Заголовки RateLimit-* ставит RateLimitHeadersMiddleware; из нескольких
+        # ограничений показываем самое близкое к исчерпанию
+        http_request = request._request
+        known = getattr(http_request, 'rate_limit', None)
+        if known is None or remaining < known[1]:
+            http_request.rate_limit = (limit, remaining, math.ceil(reset))
+
+    def wait(self):
+        return self.wait_time
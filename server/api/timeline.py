@@ -0,0 +1,177 @@
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from api.models import Follow, Post, TimelineEntry, UserProfile
+from api import projections, pubsub
+from api.pagination import keyset_filter
+from api.serializers import PostSerializer
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def fan_out_threshold():
+    return getattr(settings, 'FEED_FANOUT_THRESHOLD', 10000)
+
+
+def is_fan_out_on_read(author):
+    # Посты авторов с огромным числом подписчиков не рассылаются, а подмешиваются при чтении
+    followers_count = (
+        UserProfile.objects.filter(user_id=author.id)
+        .values_list('followers_count', flat=True)
+        .first()
+    )
+    return (followers_count or 0) >= fan_out_threshold()
+
+
+def fan_out_on_read_authors(user):
+    return list(
+        User.objects.filter(
+            followers__follower_id=user.pk,
+            profile__followers_count__gte=fan_out_threshold(),
+        ).values_list('id', flat=True)
+    )
+
+
+def _entry(owner_id, post):
+    return TimelineEntry(owner_id=owner_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+
+
+def fan_out_post(post):
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    # Посты одного автора: подписчики читаются один раз на всю пачку
+    if not posts:
+        return
+    author_id = posts[0].author_id
+    if is_fan_out_on_read(posts[0].author):
+        # Подписчики таких авторов слушают канал автора, а не свой
+        transaction.on_commit(lambda: publish_posts(posts, [pubsub.author_channel(author_id)]))
+        return
+    follower_ids = (
+        Follow.objects.filter(following_id=author_id)
+        .values_list('follower_id', flat=True)
+        .iterator(chunk_size=FANOUT_BATCH_SIZE)
+    )
+    broker = pubsub.get_broker()
+    listening = []
+    batch = []
+    for follower_id in follower_ids:
+        batch.extend(_entry(follower_id, post) for post in posts)
+        if broker.has_subscribers(pubsub.user_channel(follower_id)):
+            listening.append(pubsub.user_channel(follower_id))
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    if listening:
+        transaction.on_commit(lambda: publish_posts(posts, listening))
+
+
+def publish_posts(posts, channels):
+    data = PostSerializer(posts, many=True).data
+    for channel in channels:
+        for item in data:
+            pubsub.publish(channel, 'feed', item)
+
+
+def backfill_timeline(follower, author):
+    # После подписки переносим в ленту последние посты автора
+    if is_fan_out_on_read(author):
+        return
+    limit = getattr(settings, 'FEED_BACKFILL_SIZE', 50)
+    posts = Post.objects.filter(author=author).order_by('-created_at', '-id')[:limit]
+    TimelineEntry.objects.bulk_create([_entry(follower.id, post) for post in posts], ignore_conflicts=True)
+
+
+def remove_from_timeline(follower, author):
+    TimelineEntry.objects.filter(owner=follower, author=author).delete()
+
+
+def restore_fan_out(author):
+    # Вызывается после отписки. Посты, написанные, пока автора подмешивали при
+    # чтении, в ленты не попадали; когда подписчиков становится меньше порога,
+    # его последние посты переносятся в ленты всех подписчиков, как при подписке
+    followers_count = (
+        UserProfile.objects.filter(user_id=author.id)
+        .values_list('followers_count', flat=True)
+        .first()
+    )
+    if followers_count != fan_out_threshold() - 1:
+        return
+    limit = getattr(settings, 'FEED_BACKFILL_SIZE', 50)
+    posts = list(Post.objects.filter(author=author).order_by('-created_at', '-id')[:limit])
+    if not posts:
+        return
+    follower_ids = (
+        Follow.objects.filter(following_id=author.id)
+        .values_list('follower_id', flat=True)
+        .iterator(chunk_size=FANOUT_BATCH_SIZE)
+    )
+    batch = []
+    for follower_id in follower_ids:
+        batch.extend(_entry(follower_id, post) for post in posts)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _feed_queries(user, position, size, pull_authors):
+    own = (
+        keyset_filter(TimelineEntry.objects.filter(owner_id=user.pk), position, pk_field='post_id')
+        .values_list('created_at', 'post_id')[:size + 1]
+    )
+    pulled = (
+        keyset_filter(Post.objects.filter(author_id__in=pull_authors), position)
+        .values_list('created_at', 'id')[:size + 1]
+    )
+    return own, pulled
+
+
+def _merge_keys(keys, size):
+    return sorted(set(keys), reverse=True)[:size + 1]
+
+
+async def aread_feed(user, position, size):
+    # Асинхронный вариант read_feed: лента и список "тяжелых" авторов читаются параллельно
+    async def pull_authors():
+        authors = User.objects.filter(
+            followers__follower_id=user.pk,
+            profile__followers_count__gte=fan_out_threshold(),
+        ).values_list('id', flat=True)
+        return [author_id async for author_id in authors]
+
+    own, _ = _feed_queries(user, position, size, [])
+    own_keys, authors = await asyncio.gather(_alist(own), pull_authors())
+    keys = own_keys
+    if authors:
+        _, pulled = _feed_queries(user, position, size, authors)
+        keys += await _alist(pulled)
+    keys = _merge_keys(keys, size)
+    rows = projections.post_rows(Post.objects.filter(id__in=[post_id for _, post_id in keys]))
+    posts = {row['id']: row async for row in rows}
+    return [posts[post_id] for _, post_id in keys if post_id in posts]
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+def read_feed(user, position, size):
+    # Возвращает до size + 1 постов ленты (строки projections.post_rows), начиная после позиции курсора
+    pull_authors = fan_out_on_read_authors(user)
+    own, pulled = _feed_queries(user, position, size, pull_authors)
+    keys = list(own)
+    if pull_authors:
+        keys += list(pulled)
+    keys = _merge_keys(keys, size)
+    rows = projections.post_rows(Post.objects.filter(id__in=[post_id for _, post_id in keys]))
+    posts = {row['id']: row for row in rows}
+    return [posts[post_id] for _, post_id in keys if post_id in posts]
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+class BlacklistCache:
+    # Ограниченный LRU в памяти процесса: jti -> срок действия токена.
+    # Хранятся только отозванные токены и только до их exp - дальше токен
+    # отклоняется проверкой срока и без черного списка. "Не отозван" не
+    # кешируется: с ROTATE_REFRESH_TOKENS действующий токен проверяется один
+    # раз, а такая запись открыла бы окно для повторного использования
+    # токена, отозванного другим процессом.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti):
+        with self._lock:
+            expires = self._entries.get(jti)
+            if expires is None:
+                return False
+            if expires <= time.time():
+                del self._entries[jti]
+                return False
+            self._entries.move_to_end(jti)
+            return True
+
+    def add(self, jti, expires):
+        with self._lock:
+            self._entries[jti] = expires
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+blacklist_cache = BlacklistCache(getattr(settings, 'TOKEN_BLACKLIST_CACHE_SIZE', 10000))
+
+
+class RefreshToken(tokens.RefreshToken):
+    # Имя пользователя и is_staff попадают в claims (и в access-токен), чтобы
+    # ClaimsJWTAuthentication обходилась без чтения User
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        return token
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if jti in blacklist_cache:
+            raise TokenError(_('Token is blacklisted'))
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            blacklist_cache.add(jti, self.payload['exp'])
+            raise TokenError(_('Token is blacklisted'))
+
+    def _outstanding(self):
+        # Как в simplejwt, но без чтения User: к этому моменту пользователь
+        # уже проверен (обновление токена) или аутентифицирован (выход)
+        return OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM],
+            defaults={
+                'user_id': self.payload.get(api_settings.USER_ID_CLAIM),
+                'created_at': self.current_time,
+                'token': str(self),
+                'expires_at': datetime_from_epoch(self.payload['exp']),
+            },
+        )
+
+    def outstand(self):
+        return self._outstanding()
+
+    def blacklist(self):
+        token, _ = self._outstanding()
+        blacklisted = BlacklistedToken.objects.get_or_create(token=token)
+        # Откаченная транзакция не должна оставить токен отозванным в кеше
+        jti, exp = self.payload[api_settings.JTI_CLAIM], self.payload['exp']
+        transaction.on_commit(lambda: blacklist_cache.add(jti, exp))
+        return blacklisted
+
+
+class StreamToken(tokens.Token):
+    # Токен только для подключения к /api/stream/: EventSource не умеет ставить
+    # заголовки, и токен уходит в ?token= - в логи прокси и историю браузера.
+    # Поэтому это не access-токен: другой token_type (API его не примет),
+    # короткий срок и одно использование
+    token_type = 'stream'
+    lifetime = getattr(settings, 'STREAM_TOKEN_LIFETIME', timedelta(seconds=30))
+
+    def use(self):
+        # Повторное подключение с тем же токеном (например, из лога) отклоняется
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not cache.add(f'stream-token:{jti}', 1, int(self.lifetime.total_seconds()) + 1):
+            raise TokenError(_('Token has already been used'))
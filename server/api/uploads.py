@@ -0,0 +1,66 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+# Загрузки пишутся во временный файл по частям, не накапливаясь в памяти;
+# sha256 считается на лету, чтобы не перечитывать файл ради имени в хранилище.
+# Единственные загрузки - аватары, поэтому лимит AVATAR_MAX_UPLOAD_SIZE
+# проверяется здесь, до того как весь файл окажется на диске.
+
+
+class UploadTooLarge(MultiPartParserError):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Тело больше файла и обычных полей вместе можно отклонить, не читая
+        limit = settings.AVATAR_MAX_UPLOAD_SIZE + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if content_length > limit:
+            raise UploadTooLarge('Avatar file is too large.')
+        return super().handle_raw_input(input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.AVATAR_MAX_UPLOAD_SIZE:
+            raise UploadTooLarge('Avatar file is too large.')
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+# Тип определяется по первым байтам файла, а не по расширению
+SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+
+def sniff_image_extension(file):
+    file.seek(0)
+    header = file.read(16)
+    file.seek(0)
+    for signature, extension in SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def allowed_image_extension(file):
+    extension = sniff_image_extension(file)
+    if extension is None or extension not in settings.ALLOWED_IMAGE_EXTENSIONS:
+        return None
+    return extension
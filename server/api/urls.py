@@ -4,6 +4,7 @@ from api.views import (
     CommentDetailView,
     FeedView,
     FollowUserView,
+    LikeBatchView,
     LikePostView,
     NotificationsView,
     PostCommentsView,
@@ -12,14 +13,20 @@ from api.views import (
     ProfileView,
     RegisterView , 
     LogoutView,
+    MetricsView,
     SearchView,
+    StreamTokenView,
+    SuggestionsView,
     UnfollowUserView,
     UnlikePostView,
     UserFollowersView,
     UserFollowingView,
+    UserMutualsView,
     UserPostsView,
     UserProfileView,
 )
+from api.async_views import AsyncFeedView, AsyncNotificationsView, AsyncPostListView, AsyncUserProfileView
+from api.streaming import event_stream
 from server import settings
 from django.conf.urls.static import static
 
@@ -34,6 +41,7 @@ urlpatterns = [
     path('posts/<int:pk>/', PostRetrieveUpdateDestroyView.as_view(), name='post-detail'),
     path('posts/<int:pk>/like/', LikePostView.as_view(), name='post-like'),
     path('posts/<int:pk>/unlike/', UnlikePostView.as_view(), name='post-unlike'),
+    path('posts/likes/', LikeBatchView.as_view(), name='post-like-batch'),
 
 
     path('posts/<int:post_id>/comments/', PostCommentsView.as_view(), name='post-comments'),
@@ -48,12 +56,25 @@ urlpatterns = [
     path('users/<str:username>/unfollow/', UnfollowUserView.as_view(), name='unfollow-user'),
     path('users/<str:username>/followers/', UserFollowersView.as_view(), name='user-followers'),
     path('users/<str:username>/following/', UserFollowingView.as_view(), name='user-following'),
+    path('users/<str:username>/mutuals/', UserMutualsView.as_view(), name='user-mutuals'),
+    path('suggestions/', SuggestionsView.as_view(), name='suggestions'),
     
     # Лента и уведомления
     path('feed/', FeedView.as_view(), name='feed'),
     path('notifications/', NotificationsView.as_view(), name='notifications'),
+    path('stream/', event_stream, name='event-stream'),
+    path('stream/token/', StreamTokenView.as_view(), name='stream-token'),
     
     # Поиск
     path('search/', SearchView.as_view(), name='search'),
 
+    # Асинхронные версии читающих эндпоинтов (для ASGI)
+    path('async/posts/', AsyncPostListView.as_view(), name='async-post-list'),
+    path('async/feed/', AsyncFeedView.as_view(), name='async-feed'),
+    path('async/notifications/', AsyncNotificationsView.as_view(), name='async-notifications'),
+    path('async/users/<str:username>/', AsyncUserProfileView.as_view(), name='async-user-profile'),
+
+    # Служебное: сводка замеров производительности (только для staff)
+    path('internal/metrics/', MetricsView.as_view(), name='internal-metrics'),
+
 ]
\ No newline at end of file
@@ -1,16 +1,27 @@
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404, render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status , permissions 
 from django.contrib.auth.models import User
-from api.serializers import CommentSerializer, NotificationSerializer, PostSerializer, RegisterSerializer, UserProfileSerializer, UserProfileUpdateSerializer, UserSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from api.serializers import CommentSerializer, LikeBatchSerializer, PostSerializer, RegisterSerializer, UserProfileSerializer, UserProfileUpdateSerializer, UserSerializer
+from api.tokens import RefreshToken, StreamToken
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.utils.urls import replace_query_param
 from api.models import Comment, Follow, Notification, Post, UserProfile
-from api.permissions import IsAuthorOrReadOnly
+from api import bulk, likes, projections, queries
+from api import cache as response_cache
+from api.cache import read_through_tagged
+from api.conditional import conditional_response, make_etag, page_etag
+from api.pagination import KeysetPagination
+from api.search import get_search_backend
+from api.permissions import IsAuthorOrReadOnly, IsStaffInDatabase
+from api import instrumentation, timeline
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'register'
 
     def post(self , request):
         serializer = RegisterSerializer(data=request.data)
@@ -37,28 +48,55 @@ class PostListCreateView(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get(self , request):
-        posts = Post.objects.all().order_by('-created_at')
-        serializer = PostSerializer(posts , many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Версия общего списка меняется при любой записи, влияющей на посты, - 304 без запросов к БД
+        etag = make_etag(request.build_absolute_uri(), response_cache.get_version('posts', 'all'))
+
+        def build():
+            paginator = KeysetPagination()
+            posts = paginator.paginate_queryset(projections.post_rows(), request)
+            with instrumentation.timer('serialize'):
+                data = projections.post_data(posts)
+            return paginator.get_paginated_response(data)
+
+        return conditional_response(request, etag, build)
     
     def post(self , request):
+        if isinstance(request.data, list):
+            return self.post_many(request)
         serializer = PostSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save(author=request.user)
+            with transaction.atomic():
+                post = serializer.save(author=request.user)
+                timeline.fan_out_post(post)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def post_many(self, request):
+        # Список постов создается целиком или никак; ошибки - по одной на элемент списка
+        serializer = PostSerializer(data=request.data, many=True, allow_empty=False, max_length=settings.BULK_CREATE_MAX_SIZE)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            posts = bulk.create_posts(request.user, serializer.validated_data)
+        return Response(PostSerializer(posts, many=True).data, status=status.HTTP_201_CREATED)
+
 class PostRetrieveUpdateDestroyView(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
     def get_object(self, pk):
-        return get_object_or_404(Post, pk=pk)
+        return get_object_or_404(queries.post_list(), pk=pk)
 
     def get(self, request, pk):
-        post = self.get_object(pk)
-        serializer = PostSerializer(post)
-        return Response(serializer.data)
+        def build(deps):
+            deps.pin('post', pk)
+            post = self.get_object(pk)
+            deps.pin('user', post.author_id)
+            with instrumentation.timer('serialize'):
+                return PostSerializer(post).data
+
+        data, tag = read_through_tagged(f'post:{pk}', build)
+        return conditional_response(request, make_etag(tag), lambda: Response(data))
 
     def put(self, request, pk):
         post = self.get_object(pk)
@@ -81,48 +119,97 @@ class PostRetrieveUpdateDestroyView(APIView):
     def delete(self, request, pk):
         post = self.get_object(pk)
         self.check_object_permissions(request, post)
-        post.delete()
+        with transaction.atomic():
+            post.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 class LikePostView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'likes'
 
     def post(self, request, pk):
         post = get_object_or_404(Post, pk=pk)
-        if request.user in post.likes.all():
+        if not likes.like(request.user, [post.pk]):
             return Response({'detail': 'You already liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
-        post.likes.add(request.user)
         return Response({'detail': 'Post liked.'}, status=status.HTTP_201_CREATED)
 
 
 class UnlikePostView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'likes'
 
     def post(self, request, pk):
         post = get_object_or_404(Post, pk=pk)
-        if request.user not in post.likes.all():
+        if not likes.unlike(request.user, [post.pk]):
             return Response({'detail': 'You have not liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        post.likes.remove(request.user)
         return Response({'detail': 'Post unliked.'}, status=status.HTTP_200_OK)
+
+
+class LikeBatchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'likes'
+
+    def post(self, request):
+        # Очередь действий клиента применяется одной транзакцией;
+        # для каждого поста важно только последнее действие
+        serializer = LikeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        final = {}
+        for item in serializer.validated_data['actions']:
+            final.pop(item['post'], None)
+            final[item['post']] = item['action']
+        existing = set(Post.objects.filter(pk__in=final).values_list('id', flat=True))
+
+        with transaction.atomic():
+            changed = set(likes.like(request.user, [pk for pk, action in final.items() if action == 'like' and pk in existing]))
+            changed.update(likes.unlike(request.user, [pk for pk, action in final.items() if action == 'unlike' and pk in existing]))
+
+        results = []
+        for pk, action in final.items():
+            if pk not in existing:
+                result = 'not_found'
+            else:
+                result = 'applied' if pk in changed else 'unchanged'
+            results.append({'post': pk, 'action': action, 'result': result})
+        return Response({'results': results}, status=status.HTTP_200_OK)
     
 
 class PostCommentsView(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_scope = {'POST': 'comments'}
 
     def get(self, request, post_id):
         post = get_object_or_404(Post, id=post_id)
-        comments = post.comments.all().order_by('-created_at')
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        # Любое изменение комментариев поста увеличивает версию поста - страницу можно не читать
+        etag = make_etag(request.build_absolute_uri(), response_cache.get_version('post', post.id))
+
+        def build():
+            paginator = KeysetPagination()
+            comments = paginator.paginate_queryset(projections.comment_rows(post), request)
+            with instrumentation.timer('serialize'):
+                data = projections.comment_data(comments)
+            return paginator.get_paginated_response(data)
+
+        return conditional_response(request, etag, build)
 
     def post(self, request, post_id):
         post = get_object_or_404(Post, id=post_id)
+        if isinstance(request.data, list):
+            return self.post_many(request, post)
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(post=post, author=request.user)
+            with transaction.atomic():
+                serializer.save(post=post, author=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def post_many(self, request, post):
+        serializer = CommentSerializer(data=request.data, many=True, allow_empty=False, max_length=settings.BULK_CREATE_MAX_SIZE)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            comments = bulk.create_comments(post, request.user, serializer.validated_data)
+        return Response(CommentSerializer(comments, many=True).data, status=status.HTTP_201_CREATED)
+
 class CommentDetailView(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
@@ -132,8 +219,9 @@ class CommentDetailView(APIView):
 
     def get(self, request, post_id, comment_id):
         comment = self.get_object(post_id, comment_id)
-        serializer = CommentSerializer(comment)
-        return Response(serializer.data)
+        with instrumentation.timer('serialize'):
+            data = CommentSerializer(comment).data
+        return Response(data)
 
     def put(self, request, post_id, comment_id):
         comment = self.get_object(post_id, comment_id)
@@ -147,7 +235,8 @@ class CommentDetailView(APIView):
     def delete(self, request, post_id, comment_id):
         comment = self.get_object(post_id, comment_id)
         self.check_object_permissions(request, comment)
-        comment.delete()
+        with transaction.atomic():
+            comment.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
 
@@ -155,9 +244,10 @@ class ProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        profile = get_object_or_404(UserProfile, user=request.user)
-        serializer = UserProfileSerializer(profile, context={'request': request})
-        return Response(serializer.data)
+        profile = get_object_or_404(UserProfile.objects.select_related('user'), user_id=request.user.pk)
+        with instrumentation.timer('serialize'):
+            data = UserProfileSerializer(profile, context={'request': request}).data
+        return Response(data)
     
     def put(self, request):
         profile = get_object_or_404(UserProfile, user=request.user)
@@ -171,28 +261,52 @@ class UserProfileView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def get(self, request, username):
-        user = get_object_or_404(User, username=username)
-        
-        # Получаем или создаем профиль, если его нет
-        try:
-            profile = UserProfile.objects.get(user=user)
-        except UserProfile.DoesNotExist:
-            profile = UserProfile.objects.create(user=user, bio='', avatar=None)
-        
-        serializer = UserProfileSerializer(profile, context={'request': request})
-        return Response(serializer.data)
+        def build(deps):
+            user = get_object_or_404(User, username=username)
+            deps.pin('user', user.id)
+            
+            # Получаем или создаем профиль, если его нет
+            try:
+                profile = UserProfile.objects.select_related('user').get(user=user)
+            except UserProfile.DoesNotExist:
+                profile = UserProfile.objects.create(user=user, bio='', avatar=None)
+            
+            # is_following зависит от зрителя и в кеш не попадает
+            profile.is_following = False
+            with instrumentation.timer('serialize'):
+                data = UserProfileSerializer(profile, context={'request': request}).data
+            return {'user_id': user.id, 'data': data}
+
+        # Ссылки на аватары абсолютные - в ключе схема и хост запроса
+        origin = f'{request.scheme}://{request.get_host()}'
+        cached, tag = read_through_tagged(f'profile:{origin}:{username}', build)
+        is_following = queries.is_following(request, cached['user_id'])
+        return conditional_response(
+            request,
+            make_etag(tag, is_following),
+            lambda: Response({**cached['data'], 'is_following': is_following}),
+        )
 
 class UserPostsView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def get(self, request, username):
-        user = get_object_or_404(User, username=username)
-        posts = Post.objects.filter(author=user).order_by('-created_at')
-        serializer = PostSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        def build(deps):
+            user = get_object_or_404(User, username=username)
+            deps.pin('user', user.id)
+            paginator = KeysetPagination()
+            posts = paginator.paginate_queryset(projections.post_rows(Post.objects.filter(author=user)), request)
+            with instrumentation.timer('serialize'):
+                data = projections.post_data(posts)
+            return paginator.get_paginated_response(data).data
+
+        # Ссылка next абсолютная, поэтому ключ - полный адрес, а не только путь
+        data, tag = read_through_tagged(f'user-posts:{request.build_absolute_uri()}', build)
+        return conditional_response(request, make_etag(tag), lambda: Response(data))
 
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'follows'
     
     def post(self, request, username):
         user_to_follow = get_object_or_404(User, username=username)
@@ -200,32 +314,33 @@ class FollowUserView(APIView):
         if user_to_follow == request.user:
             return Response({'detail': 'You cannot follow yourself.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        follow, created = Follow.objects.get_or_create(
-            follower=request.user,
-            following=user_to_follow
-        )
+        with transaction.atomic():
+            follow, created = Follow.objects.get_or_create(
+                follower=request.user,
+                following=user_to_follow
+            )
+            if created:
+                timeline.backfill_timeline(request.user, user_to_follow)
         
         if not created:
             return Response({'detail': 'You are already following this user.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Создание уведомления
-        Notification.objects.create(
-            recipient=user_to_follow,
-            sender=request.user,
-            notification_type='follow'
-        )
-        
+        # Уведомление создается фоновым обработчиком из outbox (api.notifications)
         return Response({'detail': 'Successfully followed user.'}, status=status.HTTP_201_CREATED)
 
 class UnfollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'follows'
     
     def post(self, request, username):
         user_to_unfollow = get_object_or_404(User, username=username)
         
         try:
             follow = Follow.objects.get(follower=request.user, following=user_to_unfollow)
-            follow.delete()
+            with transaction.atomic():
+                follow.delete()
+                timeline.remove_from_timeline(request.user, user_to_unfollow)
+                timeline.restore_fan_out(user_to_unfollow)
             return Response({'detail': 'Successfully unfollowed user.'}, status=status.HTTP_200_OK)
         except Follow.DoesNotExist:
             return Response({'detail': 'You are not following this user.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -235,65 +350,143 @@ class UserFollowersView(APIView):
     
     def get(self, request, username):
         user = get_object_or_404(User, username=username)
-        followers = User.objects.filter(following__following=user)
-        serializer = UserSerializer(followers, many=True, context={'request': request})
-        return Response(serializer.data)
+        paginator = KeysetPagination()
+        edges = paginator.paginate_queryset(queries.follow_edges('follower', request, following=user), request)
+        followers = queries.edge_users(edges, 'follower')
+        with instrumentation.timer('serialize'):
+            data = UserSerializer(followers, many=True, context={'request': request}).data
+        return paginator.get_paginated_response(data)
 
 class UserFollowingView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def get(self, request, username):
         user = get_object_or_404(User, username=username)
-        following = User.objects.filter(followers__follower=user)
-        serializer = UserSerializer(following, many=True, context={'request': request})
-        return Response(serializer.data)
+        paginator = KeysetPagination()
+        edges = paginator.paginate_queryset(queries.follow_edges('following', request, follower=user), request)
+        following = queries.edge_users(edges, 'following')
+        with instrumentation.timer('serialize'):
+            data = UserSerializer(following, many=True, context={'request': request}).data
+        return paginator.get_paginated_response(data)
+
+def users_by_ids(user_ids, request=None):
+    users = queries.user_list(User.objects.filter(id__in=user_ids), request).in_bulk()
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+class UserMutualsView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, username):
+        # Взаимные подписки - из графа в памяти или одним запросом (api.queries.mutual_ids)
+        user = get_object_or_404(User, username=username)
+        page_size = KeysetPagination().get_page_size(request)
+        mutuals = users_by_ids(queries.mutual_ids(user.id, page_size), request)
+        with instrumentation.timer('serialize'):
+            data = UserSerializer(mutuals, many=True, context={'request': request}).data
+        return Response({'results': data})
+
+class SuggestionsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        page_size = KeysetPagination().get_page_size(request)
+        suggested = users_by_ids(queries.suggested_ids(request.user.id, page_size), request)
+        with instrumentation.timer('serialize'):
+            data = UserSerializer(suggested, many=True, context={'request': request}).data
+        return Response({'results': data})
 
 class FeedView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        # Получаем пользователей, на которых подписан текущий пользователь
-        following_users = User.objects.filter(followers__follower=request.user)
-        
-        # Получаем посты от этих пользователей
-        posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
-        
-        serializer = PostSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        # Читаем материализованную ленту страницей по курсору
+        paginator = KeysetPagination()
+        posts = timeline.read_feed(
+            request.user,
+            paginator.get_position(request),
+            paginator.get_page_size(request),
+        )
+        posts = paginator.paginate_rows(posts, request)
+
+        def build():
+            with instrumentation.timer('serialize'):
+                data = projections.post_data(posts)
+            return paginator.get_paginated_response(data)
+
+        return conditional_response(request, page_etag(request, posts, request.user.pk), build)
 
 class NotificationsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination()
+        notifications = paginator.paginate_queryset(projections.notification_rows(request.user.pk), request)
+        with instrumentation.timer('serialize'):
+            data = projections.notification_data(notifications)
+        return paginator.get_paginated_response(data)
     
     def patch(self, request):
         # Отметить все уведомления как прочитанные
         Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
         return Response({'detail': 'All notifications marked as read.'}, status=status.HTTP_200_OK)
 
+class StreamTokenView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        # Одноразовый короткоживущий токен для ?token= у /api/stream/
+        token = StreamToken.for_user(request.user)
+        return Response({'token': str(token), 'expires_in': int(token.lifetime.total_seconds())}, status=status.HTTP_201_CREATED)
+
 class SearchView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'search'
     
     def get(self, request):
         query = request.GET.get('q', '')
         if not query:
             return Response({'detail': 'Search query is required.'}, status=status.HTTP_400_BAD_REQUEST)
         
+        paginator = KeysetPagination()
+        page_size = paginator.get_page_size(request)
+        try:
+            page = max(1, int(request.GET.get('page', 1)))
+        except ValueError:
+            page = 1
+        backend = get_search_backend()
+
         # Поиск пользователей
-        users = User.objects.filter(
-            Q(username__icontains=query) | Q(email__icontains=query)
-        )[:10]
+        users = users_by_ids(backend.search_users(query, 10), request)
         
-        # Поиск постов
-        posts = Post.objects.filter(content__icontains=query).order_by('-created_at')[:20]
+        # Поиск постов: по релевантности, страница с запасом в одну строку
+        post_ids = backend.search_posts(query, (page - 1) * page_size, page_size + 1)
+        has_next = len(post_ids) > page_size
+        rows = projections.post_rows(Post.objects.filter(id__in=post_ids[:page_size]))
+        posts = {row['id']: row for row in rows}
+        posts = [posts[post_id] for post_id in post_ids[:page_size] if post_id in posts]
         
-        users_serializer = UserSerializer(users, many=True, context={'request': request})
-        posts_serializer = PostSerializer(posts, many=True, context={'request': request})
+        with instrumentation.timer('serialize'):
+            data = {
+                'users': UserSerializer(users, many=True, context={'request': request}).data,
+                'posts': projections.post_data(posts),
+            }
         
         return Response({
-            'users': users_serializer.data,
-            'posts': posts_serializer.data
-        })
\ No newline at end of file
+            **data,
+            'next': replace_query_param(request.build_absolute_uri(), 'page', page + 1) if has_next else None,
+        })
+
+
+class MetricsView(APIView):
+    # Сводка замеров api.instrumentation по вью (в памяти текущего процесса)
+    permission_classes = [IsStaffInDatabase]
+
+    def get(self, request):
+        return Response({
+            'sample_rate': settings.PERF_SAMPLE_RATE,
+            'views': instrumentation.registry.snapshot(),
+        })
+
+    def delete(self, request):
+        instrumentation.registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -19,13 +19,25 @@ ALLOWED_HOSTS = []
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Раздавать MEDIA_ROOT самим Django (api.media) - только для разработки, как static();
+# в продакшене загрузки отдает веб-сервер
+SERVE_MEDIA = DEBUG
 # Application definition
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 
-# Разрешенные типы файлов для аватаров
+# Загрузки пишутся во временный файл по частям, sha256 считается на лету
+FILE_UPLOAD_HANDLERS = ['api.uploads.HashingTemporaryFileUploadHandler']
+AVATAR_MAX_UPLOAD_SIZE = 5242880  # 5MB
+
+# Разрешенные типы файлов для аватаров (тип определяется по содержимому)
 ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
 
+# Квадратные копии аватаров (WebP и JPEG), строятся в пуле потоков после коммита
+AVATAR_VARIANT_SIZES = (64, 256)
+AVATAR_WORKERS = 2
+AVATAR_PROCESSING_ASYNC = True
+
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -40,21 +52,117 @@ INSTALLED_APPS = [
     'api', 
 ]
 
+# Чтение доверяет claims access-токена (api.authentication.ClaimsJWTAuthentication):
+# снятые права и деактивация видны читающим вью только после его истечения,
+# поэтому срок короткий. Служебные вью (IsStaffInDatabase) проверяют is_staff в БД
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'BLACKLIST_AFTER_ROTATION': True,
     'ROTATE_REFRESH_TOKENS': True,
+    # Токены несут username и is_staff (api.tokens), обновление читает User один раз
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.CachedTokenRefreshSerializer',
 }
 
+# Ограничение частоты запросов; счетчики лежат в кеше, при нескольких процессах
+# нужен общий кеш с атомарным incr (memcached, redis). Файловый кеш (CACHE_DIR)
+# incr не атомарен - с ним и включенным ограничением проверка api.E001 не дает
+# запуститься. Scope из THROTTLE_IP_SCOPES считаются по IP даже для вошедших
+# пользователей
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_IP_SCOPES = ('register',)
+
+# Сколько отозванных refresh-токенов помнит процесс (api.tokens.blacklist_cache)
+TOKEN_BLACKLIST_CACHE_SIZE = 10000
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Чтение - пользователь из claims токена без запроса к БД
+        'api.authentication.ClaimsJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Лимиты по throttle_scope вью (api.throttling), считаются на пользователя или IP
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.SlidingWindowThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'register': '10/h',
+        'likes': '120/min',
+        'follows': '60/min',
+        'comments': '30/min',
+        'search': '60/min',
+    },
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
+# Кодирование JSON в API: 'orjson' (если установлен) или 'json' из stdlib
+JSON_BACKEND = 'orjson'
+
+# Сжатие ответов (api.middleware.CompressionMiddleware): brotli, если установлен
+# и поддерживается клиентом, иначе gzip; ответы меньше порога не сжимаются
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Курсорная пагинация списков (?page_size=, ?cursor=)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Лента: посты рассылаются подписчикам при публикации (fan-out on write),
+# авторы с числом подписчиков от порога подмешиваются при чтении
+FEED_FANOUT_THRESHOLD = 10000
+FEED_BACKFILL_SIZE = 50
+
+# Максимум объектов при создании списком (POST posts/ и posts/<id>/comments/ с массивом)
+BULK_CREATE_MAX_SIZE = 1000
+
+# Максимум действий в одном запросе posts/likes/
+LIKE_BATCH_MAX_SIZE = 100
+
+# Граф подписок в памяти (api.graph) для общих подписок и рекомендаций;
+# перечитывается из БД в фоне раз в FOLLOW_GRAPH_MAX_AGE секунд. Изменения
+# из других процессов видны только после перезагрузки
+FOLLOW_GRAPH_ENABLED = False
+FOLLOW_GRAPH_MAX_AGE = 300
+
+# Бэкенд полнотекстового поиска (api.search); None - выбор по типу БД:
+# FTS5 для SQLite, tsvector/pg_trgm для PostgreSQL
+SEARCH_BACKEND = None
+
+# Уведомления создаются фоновым потоком из outbox; False - сразу после коммита
+NOTIFICATIONS_ASYNC = True
+NOTIFICATION_BATCH_SIZE = 1000
+NOTIFICATION_POLL_INTERVAL = 5
+NOTIFICATION_COALESCE_WINDOW = 0.5
+# Сколько отправителей склеенного уведомления хранится для отсева повторов
+NOTIFICATION_MAX_SENDER_IDS = 100
+
+# Потоковая доставка уведомлений и ленты (/api/stream/, SSE)
+PUBSUB_BACKEND = 'api.pubsub.InProcessBroker'
+STREAM_HEARTBEAT = 15
+# Срок одноразового токена для ?token= у /api/stream/ (POST /api/stream/token/)
+STREAM_TOKEN_LIFETIME = timedelta(seconds=30)
+
+# Замеры запросов (api.instrumentation): доля запросов с замером SQL и рендеринга,
+# заголовок Server-Timing и сводка в api/internal/metrics/; 0 - выключено
+PERF_SAMPLE_RATE = 0.0
+PERF_N_PLUS_ONE_THRESHOLD = 10
+PERF_HISTOGRAM_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
 MIDDLEWARE = [
+    'api.instrumentation.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
+    'api.middleware.RateLimitHeadersMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,13 +196,110 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Настройки берутся из окружения. DB_ENGINE: sqlite (по умолчанию, файл DB_NAME)
+# или postgresql (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT).
+# Соединения живут DB_CONN_MAX_AGE секунд и проверяются перед повторным
+# использованием. DB_POOL_MAX_SIZE > 0 включает пул psycopg (нужен psycopg[pool]);
+# пул сам держит соединения, поэтому CONN_MAX_AGE с ним равен 0.
+# DB_REPLICAS - реплики для чтения через запятую: хосты PostgreSQL или файлы
+# SQLite (локальная проверка, копии обновляет manage.py sync_replicas).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+
+# Режим SQLite для одного сервера с конкурентной нагрузкой (DB_SQLITE_WAL=1):
+# WAL - читатели не ждут писателя, synchronous=NORMAL - без fsync на каждый коммит
+# (в WAL это безопасно для целостности), mmap и кеш страниц 64 МБ.
+# journal_mode=WAL сохраняется в самом файле базы.
+DB_SQLITE_WAL = os.environ.get('DB_SQLITE_WAL', '') == '1'
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA mmap_size=268435456;'
+    'PRAGMA cache_size=-65536;'
+    'PRAGMA temp_store=MEMORY;'
+)
+
+
+def _database(location):
+    if DB_ENGINE == 'postgresql':
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'bailanysta'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': location,
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+        if DB_POOL_MAX_SIZE:
+            config['CONN_MAX_AGE'] = 0
+            config['OPTIONS'] = {'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            }}
+        return config
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': location,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if DB_SQLITE_WAL:
+        config['OPTIONS'] = {
+            # Ждать освободившуюся блокировку, а не сразу падать с "database is locked"
+            'timeout': int(os.environ.get('DB_SQLITE_BUSY_TIMEOUT', 20)),
+            # Транзакция сразу берет блокировку на запись: без этого два читателя,
+            # одновременно перешедшие к записи, получают взаимную блокировку
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': SQLITE_PRAGMAS,
+        }
+    return config
+
+
 DATABASES = {
+    'default': _database(
+        os.environ.get('DB_HOST', '') if DB_ENGINE == 'postgresql'
+        else os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3')
+    ),
+}
+
+# Реплики: в тестах смотрят в тестовую базу default
+REPLICA_DATABASES = []
+for index, location in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {**_database(location.strip()), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+# Чтения безопасных запросов идут в реплики, все остальное - в default (api.routers).
+# После записи пользователя его чтения REPLICA_STICKY_SECONDS идут в default,
+# чтобы он видел свои изменения несмотря на отставание реплик.
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter'] if REPLICA_DATABASES else []
+REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# Локально - в памяти процесса; CACHE_DIR включает файловый кеш, общий для процессов
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bailanysta',
     }
 }
 
+if os.environ.get('CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['CACHE_DIR'],
+    }
+
+# Мягкий срок жизни закешированных ответов (api.cache), секунды
+RESPONSE_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
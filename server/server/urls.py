@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path , include
+from django.urls import path , include, re_path
+
+from api.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
+
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+    ]